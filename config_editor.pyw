@@ -4,6 +4,7 @@ import tkinter.ttk as ttk
 import json
 import os
 import pandas as pd
+from csv_encoding import read_csv_auto
 
 CONFIG_FILE = 'config.json'
 
@@ -147,17 +148,14 @@ class ConfigEditorApp:
                 '請求書等の宛名を変更したい場合は、こちらにご入力ください。', '自由設定項目4', '自由設定項目5'
             ]
         
-        # 複数エンコーディングでCSVヘッダーを読み込み
-        encodings = ['utf-8-sig', 'utf-8', 'cp932', 'shift_jis', 'iso-2022-jp']
-        
-        for encoding in encodings:
-            try:
-                df = pd.read_csv(csv_path, encoding=encoding, nrows=0)
-                return df.columns.tolist()
-            except Exception:
-                continue
+        # エンコーディングを判定してCSVヘッダーを読み込み
+        try:
+            df, _ = read_csv_auto(csv_path, nrows=0)
+            return df.columns.tolist()
+        except Exception:
+            pass
         
-        # 全て失敗した場合はデフォルトを返す
+        # 読み込めなかった場合はデフォルトを返す
         return ['booking_datetime', 'room_name', 'company_name', 'display_name', 'notes']
 
     def setup_scrollable_frame(self, parent, name):
@@ -349,16 +347,12 @@ class ConfigEditorApp:
     def process_csv_file(self, file_path):
         """CSVファイルを処理して設定に反映"""
         try:
-            # 複数エンコーディングでCSVを読み込み
-            encodings = ['utf-8-sig', 'utf-8', 'cp932', 'shift_jis', 'iso-2022-jp']
+            # エンコーディングを判定してCSVを読み込み
             df = None
-
-            for encoding in encodings:
-                try:
-                    df = pd.read_csv(file_path, encoding=encoding)
-                    break
-                except Exception:
-                    continue
+            try:
+                df, _ = read_csv_auto(file_path)
+            except Exception:
+                pass
 
             if df is None:
                 messagebox.showerror("❌ エラー", "CSVファイルを読み込めませんでした。エンコーディングを確認してください。")
@@ -472,16 +466,12 @@ class ConfigEditorApp:
     def process_csv_popup_fields_only(self, file_path):
         """ポップアップ項目のみCSVファイルを処理"""
         try:
-            # 複数エンコーディングでCSVを読み込み
-            encodings = ['utf-8-sig', 'utf-8', 'cp932', 'shift_jis', 'iso-2022-jp']
+            # エンコーディングを判定してCSVを読み込み
             df = None
-
-            for encoding in encodings:
-                try:
-                    df = pd.read_csv(file_path, encoding=encoding)
-                    break
-                except Exception:
-                    continue
+            try:
+                df, _ = read_csv_auto(file_path)
+            except Exception:
+                pass
 
             if df is None:
                 messagebox.showerror("❌ エラー", "CSVファイルを読み込めませんでした。エンコーディングを確認してください。")
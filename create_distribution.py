@@ -34,6 +34,8 @@ def create_distribution():
     required_files = [
         # メインアプリケーション
         "server_fixed.py",
+        "csv_encoding.py",
+        "ingest_worker.py",
         "config_editor.pyw",
         "index.html",
         "requirements.txt",
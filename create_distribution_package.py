@@ -31,6 +31,8 @@ def create_distribution():
     # 必須ファイル
     required_files = [
         "server_fixed.py",
+        "csv_encoding.py",
+        "ingest_worker.py",
         "config_editor.pyw",
         "index.html",
         "requirements.txt",
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+会議室予約システム - CSVエンコーディング判定
+ファイル先頭の一定バイト数だけを調べてエンコーディングを判定します
+（server_fixed.py と config_editor.pyw で共用）
+"""
+
+import codecs
+import os
+import threading
+import pandas as pd
+
+# 判定に使う先頭バイト数
+SNIFF_BYTES = 64 * 1024
+
+# 判定結果で読めなかった場合に試すエンコーディング（従来の順番）
+FALLBACK_ENCODINGS = ['utf-8-sig', 'cp932', 'shift_jis', 'utf-8', 'iso-2022-jp']
+
+# ISO-2022-JPのエスケープシーケンス
+ISO2022JP_ESCAPES = (b'\x1b$B', b'\x1b$@', b'\x1b(J')
+
+# 判定結果のキャッシュ {絶対パス: (サイズ, 更新時刻, エンコーディング, 確信度)}
+MAX_CACHE_ENTRIES = 256
+_encoding_cache = {}
+_encoding_cache_lock = threading.Lock()
+
+def _decodes_as(data, encoding, complete):
+    """バイト列が指定エンコーディングとして正しく読めるか確認"""
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)(errors='strict')
+        # 途中で切れたマルチバイト文字はエラーにしない（ファイル全体を読んだ場合を除く）
+        decoder.decode(data, final=complete)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def sniff_encoding(data, complete=False):
+    """バイト列からエンコーディングを判定し (エンコーディング, 確信度) を返す
+
+    complete は data がファイル全体かどうか（Falseなら末尾の途中切れを許容）
+    """
+    if data.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig', 1.0
+
+    if any(escape in data for escape in ISO2022JP_ESCAPES):
+        return 'iso-2022-jp', 0.9
+
+    if data.isascii():
+        # 先頭がASCIIのみの場合、残りの部分は分からないためUTF-8と推定
+        return 'utf-8', 1.0 if complete else 0.5
+
+    if _decodes_as(data, 'utf-8', complete):
+        return 'utf-8', 0.99
+
+    if _decodes_as(data, 'cp932', complete):
+        return 'cp932', 0.9
+
+    # どれにも当てはまらない場合は日本語CSVで最も多いcp932を推定
+    return 'cp932', 0.1
+
+def detect_encoding(file_path):
+    """ファイルのエンコーディングを判定（サイズ・更新時刻が同じならキャッシュを使用）"""
+    stat = os.stat(file_path)
+    cache_key = os.path.abspath(file_path)
+
+    with _encoding_cache_lock:
+        cached = _encoding_cache.get(cache_key)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2], cached[3]
+
+    with open(file_path, 'rb') as f:
+        data = f.read(SNIFF_BYTES)
+    encoding, confidence = sniff_encoding(data, complete=stat.st_size <= SNIFF_BYTES)
+
+    _store_encoding(cache_key, stat, encoding, confidence)
+    return encoding, confidence
+
+def _store_encoding(cache_key, stat, encoding, confidence):
+    """判定結果をキャッシュに保存"""
+    with _encoding_cache_lock:
+        _encoding_cache.pop(cache_key, None)
+        if len(_encoding_cache) >= MAX_CACHE_ENTRIES:
+            # 最も古いエントリを削除
+            _encoding_cache.pop(next(iter(_encoding_cache)))
+        _encoding_cache[cache_key] = (stat.st_size, stat.st_mtime_ns, encoding, confidence)
+
+def _read_with_fallback(file_path, read):
+    """判定したエンコーディングで read(encoding) を呼び、読めなかった場合のみ従来のエンコーディングを順番に試す"""
+    encoding, confidence = detect_encoding(file_path)
+    try:
+        return read(encoding), encoding
+    except UnicodeDecodeError:
+        pass
+
+    for fallback in FALLBACK_ENCODINGS:
+        if fallback == encoding:
+            continue
+        try:
+            result = read(fallback)
+        except UnicodeDecodeError:
+            continue
+        # 実際に読めたエンコーディングを記録しておく
+        _store_encoding(os.path.abspath(file_path), os.stat(file_path), fallback, 1.0)
+        return result, fallback
+
+    raise UnicodeDecodeError(encoding, b'', 0, 1, f"Could not decode {os.path.basename(file_path)} with any supported encoding")
+
+def read_csv_auto(file_path, **kwargs):
+    """エンコーディングを判定してCSVを読み込み (DataFrame, エンコーディング) を返す
+
+    判定したエンコーディングで読めなかった場合のみ、従来のエンコーディングを順番に試す
+    """
+    return _read_with_fallback(file_path, lambda encoding: pd.read_csv(file_path, encoding=encoding, **kwargs))
+
+def read_csv_chunks_auto(file_path, process_chunk, chunksize, **kwargs):
+    """CSVを chunksize 行ずつ読み込み、各チャンクに process_chunk を適用した結果のリストを返す
+
+    ファイル全体を一度に読み込まないため、process_chunk で列・行を絞り込めばメモリ使用量を抑えられる。
+    途中で読めない文字があった場合は、それまでの結果を捨てて次のエンコーディングで読み直す
+    （process_chunk は同じチャンクに対して何度呼ばれてもよい処理にすること）
+    """
+    def read(encoding):
+        with pd.read_csv(file_path, encoding=encoding, chunksize=chunksize, **kwargs) as reader:
+            return [process_chunk(chunk) for chunk in reader]
+
+    return _read_with_fallback(file_path, read)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+会議室予約システム - 予約CSVの取り込み処理（行ごとの処理）
+利用日時・延長の解析、会議室IDの解決と、アップロードされたCSVの読み込みを行います
+（server_fixed.py で使用。並列取り込みのワーカープロセスはこのモジュールだけを読み込むため、
+読み込み時にログの設定やFlaskアプリの作成などを行わないこと）
+"""
+
+import logging
+import os
+import re
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+from csv_encoding import read_csv_auto, read_csv_chunks_auto
+
+# 「一日」予約を分割する時間帯（この順番で行を展開する）
+ALL_DAY_SLOTS = ['午前', '午後', '夜間']
+
+SLOT_IDS = {'午前': 'morning', '午後': 'afternoon', '夜間': 'night'}
+
+# 複数の時間帯をまとめた予約の区切り 例: "2025年10月3日 午前・午後"
+SLOT_SEPARATOR_PATTERN = r'\s*[・、,，/／]\s*'
+
+def get_booking_slot_labels(slot_text):
+    """時間帯の部分（「一日」「午前・午後」など）を展開する時間帯の一覧にする（展開しない場合はNone）"""
+    if slot_text == '一日':
+        return ALL_DAY_SLOTS
+    parts = re.split(SLOT_SEPARATOR_PATTERN, slot_text)
+    if len(parts) > 1 and all(part in SLOT_IDS for part in parts):
+        return list(dict.fromkeys(parts))
+    return None
+
+def expand_all_day_bookings(df, datetime_col):
+    """「一日」予約を午前・午後・夜間の3行に、「午前・午後」のような予約を時間帯ごとの行に列単位で展開する（行の順序は維持）"""
+    if datetime_col not in df.columns or df.empty:
+        return df
+
+    # 日付の部分と時間帯の部分に分ける（時間帯の書き方の種類は少ないため、種類ごとに展開方法を決める）
+    parts = df[datetime_col].astype(str).str.extract(r'^(.*日\s*)(\S.*?)\s*$')
+    codes, slot_texts = pd.factorize(parts[1].fillna(''))
+    slot_labels = [get_booking_slot_labels(text) for text in slot_texts]
+    if not any(slot_labels):
+        return df
+
+    # 展開する行は時間帯の数だけ、それ以外は1回繰り返す
+    label_counts = np.array([len(labels) if labels else 1 for labels in slot_labels])
+    label_table = np.array([(labels or []) + [''] * (label_counts.max() - len(labels or [])) for labels in slot_labels], dtype=object)
+    repeats = label_counts[codes]
+    positions = np.repeat(np.arange(len(df)), repeats)
+    expanded_df = df.iloc[positions].copy()
+
+    # 展開後の各行が元の行の何番目のコピーかを求めて時間帯ラベルを割り当てる
+    group_starts = np.repeat(np.cumsum(repeats) - repeats, repeats)
+    slot_offsets = np.arange(len(positions)) - group_starts
+    expanded_mask = np.array([labels is not None for labels in slot_labels])[codes][positions]
+    labels = label_table[codes[positions], slot_offsets]
+
+    base_values = parts[0].fillna('').to_numpy(dtype=object)[positions]
+    original_values = expanded_df[datetime_col].to_numpy(dtype=object)
+    expanded_df[datetime_col] = np.where(expanded_mask, base_values + labels, original_values)
+
+    return expanded_df
+
+# 利用日時(予約内容) の書式 例: "2025年7月23日 午後"（値全体が一致しない行は解析できない行として除外する）
+BOOKING_DATETIME_PATTERN = r'^\s*(\d{4})年(\d{1,2})月(\d{1,2})日\s*(午前|午後|夜間)\s*$'
+
+def extract_booking_date_slot(values):
+    """利用日時の列からISO形式の日付と時間帯IDを取り出す（解析できない行は空文字）"""
+    parts = pd.Series(values).astype(str).str.extract(BOOKING_DATETIME_PATTERN)
+    dates = parts[0] + '-' + parts[1].str.zfill(2) + '-' + parts[2].str.zfill(2)
+    slots = parts[3].map(SLOT_IDS)
+    return pd.DataFrame({'date': dates.fillna(''), 'slot': slots.fillna('')}, index=parts.index)
+
+# 時間帯ごとの利用時間のデフォルト値（config.json の "slot_times" で上書き可能）
+DEFAULT_SLOT_TIMES = {
+    'morning': ['09:00', '12:00'],
+    'afternoon': ['13:00', '17:00'],
+    'night': ['18:00', '21:00'],
+}
+
+# 延長(予約内容) の時刻範囲 例: "後延長 17:00～18:00"
+EXTENSION_TIME_PATTERN = r'(\d{1,2}):(\d{2})\s*[～〜~\-－]\s*(\d{1,2}):(\d{2})'
+
+def parse_time_minutes(value):
+    """HH:MM を0時からの分数に変換（不正な値はValueError）"""
+    hours, minutes = str(value).split(':')
+    result = int(hours) * 60 + int(minutes)
+    if not 0 <= int(minutes) < 60 or not 0 <= result <= 24 * 60:
+        raise ValueError(f"Invalid time: {value}")
+    return result
+
+def get_slot_times(config):
+    """時間帯ID → (開始分, 終了分) を取得（未設定の時間帯はデフォルト値）"""
+    slot_times = dict(DEFAULT_SLOT_TIMES)
+    if config:
+        slot_times.update(config.get('slot_times') or {})
+    return {slot: (parse_time_minutes(start), parse_time_minutes(end)) for slot, (start, end) in slot_times.items()}
+
+def add_interval_columns(df, config):
+    """時間帯と延長から利用時間を求め start_minute・end_minute 列（0時からの分数）を追加
+
+    延長の時刻範囲が時間帯に接している（または重なる）場合に、その範囲まで利用時間を広げる
+    （一日予約を展開した行では、午後の後延長が午前の行に付かないようにする）
+    """
+    extension_col = (config or {}).get('csv_column_mapping', {}).get('extension', '延長(予約内容)')
+    slot_times = get_slot_times(config)
+    slots = pd.Series(df['slot'].to_numpy(dtype=object))
+    starts = slots.map({slot: times[0] for slot, times in slot_times.items()}).to_numpy(dtype=float)
+    ends = slots.map({slot: times[1] for slot, times in slot_times.items()}).to_numpy(dtype=float)
+
+    if extension_col in df.columns:
+        # 1つの値に複数の延長がある場合もまとめて抽出（行番号ごとに最小の開始・最大の終了）
+        times = pd.Series(df[extension_col].astype(str).to_numpy()).str.extractall(EXTENSION_TIME_PATTERN).astype(int)
+        if not times.empty:
+            positions = times.index.get_level_values(0).to_numpy()
+            extension_starts = (times[0] * 60 + times[1]).to_numpy()
+            extension_ends = (times[2] * 60 + times[3]).to_numpy()
+            adjacent = (extension_starts <= ends[positions]) & (extension_ends >= starts[positions])
+            np.fmin.at(starts, positions[adjacent], extension_starts[adjacent])
+            np.fmax.at(ends, positions[adjacent], extension_ends[adjacent])
+
+    df['start_minute'] = np.nan_to_num(starts, nan=0).astype(int)
+    df['end_minute'] = np.nan_to_num(ends, nan=0).astype(int)
+    return df
+
+# 会議室名の表記ゆれ（全角数字・全角括弧）を揃える変換表
+ROOM_NAME_TRANSLATION = str.maketrans({**{chr(0xFF10 + i): str(i) for i in range(10)}, '（': '(', '）': ')'})
+
+def normalize_room_name(name):
+    """会議室名を比較用に正規化"""
+    return str(name).translate(ROOM_NAME_TRANSLATION)
+
+def build_room_lookup(config):
+    """CSVの会議室名 → 会議室ID の対応表を作成（完全一致を正規化一致より優先）"""
+    rooms = (config or {}).get('rooms', [])
+    lookup = {}
+    for room in rooms:
+        csv_name = room.get('csv_name')
+        if csv_name:
+            lookup.setdefault(normalize_room_name(csv_name), room.get('id', ''))
+    for room in rooms:
+        csv_name = room.get('csv_name')
+        if csv_name:
+            lookup[csv_name] = room.get('id', '')
+    return lookup
+
+def resolve_room_ids(values, room_lookup):
+    """会議室名の列を会議室IDの列に変換（見つからない場合は空文字）"""
+    values = pd.Series(values).astype(str)
+    mapping = {}
+    for name in values.unique():
+        mapping[name] = room_lookup.get(name) or room_lookup.get(normalize_room_name(name), '')
+    return values.map(mapping)
+
+def add_room_id_column(df, config):
+    """会議室名から会議室IDを求めて room_id 列に保存（取り込み時に1回だけ行う）"""
+    room_col = (config or {}).get('csv_column_mapping', {}).get('room_name', '会議室(予約内容)')
+    names = df[room_col] if room_col in df.columns else pd.Series([''] * len(df), index=df.index)
+    room_ids = resolve_room_ids(names, build_room_lookup(config))
+    df['room_id'] = room_ids.to_numpy(dtype=object)
+
+    unresolved = names[(room_ids == '').to_numpy()].astype(str).unique()
+    if len(unresolved):
+        logging.warning(f"Room not found in config: {', '.join(unresolved)}")
+    return df
+
+def add_date_slot_columns(df, config):
+    """利用日時を解析して date（YYYY-MM-DD）・slot（morning/afternoon/night）列を追加
+
+    解析できない行は除外し、(解析済みの行, 除外した行) を返す
+    """
+    datetime_col = (config or {}).get('csv_column_mapping', {}).get('booking_datetime', '利用日時(予約内容)')
+    values = df[datetime_col] if datetime_col in df.columns else pd.Series([''] * len(df), index=df.index)
+    date_slot = extract_booking_date_slot(values)
+    df['date'] = date_slot['date'].to_numpy(dtype=object)
+    df['slot'] = date_slot['slot'].to_numpy(dtype=object)
+
+    parsed = ((df['date'] != '') & (df['slot'] != '')).to_numpy()
+    rejected = df[~parsed].drop(columns=['date', 'slot'])
+    rejected.insert(0, 'reject_reason', f"{datetime_col}を解析できません")
+    return df[parsed], rejected
+
+def normalize_booking_keys(values):
+    """申込NOを比較用の文字列に揃える（12 / 12.0 / " 12" を同一視）"""
+    keys = pd.Series(values).astype(str).str.strip()
+    return keys.str.replace(r'\.0$', '', regex=True)
+
+def get_booking_row_hashes(df, config):
+    """申込NO・利用日時・会議室 から行のハッシュ値を求める（申込NOがない行は0）
+
+    同じ申込NO・利用日時でも会議室が違う行（複数の部屋の予約）は別の行として扱う
+    """
+    csv_column_mapping = (config or {}).get('csv_column_mapping', {})
+    key_col = csv_column_mapping.get('booking_id', '申込NO')
+    empty = pd.Series([''] * len(df), index=df.index)
+    booking_nos = normalize_booking_keys(df[key_col]) if key_col in df.columns else empty
+    keys = pd.DataFrame({
+        'booking_no': booking_nos,
+        'datetime': df.get(csv_column_mapping.get('booking_datetime', '利用日時(予約内容)'), empty).astype(str),
+        'room': df.get(csv_column_mapping.get('room_name', '会議室(予約内容)'), empty).astype(str),
+    })
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    return np.where(booking_nos.to_numpy() != '', hashes, 0)
+
+def split_cancelled_bookings(df, config):
+    """取消日のある行を分けて (有効な行, 取り消された行) を返す"""
+    cancel_col = (config or {}).get('csv_column_mapping', {}).get('cancellation_date', '取消日(予約内容)')
+    if cancel_col not in df.columns:
+        return df, df.iloc[0:0]
+    cancelled = ~df[cancel_col].astype(str).str.strip().isin(['', 'nan']).to_numpy()
+    return df[~cancelled], df[cancelled]
+
+def prepare_booking_rows(df, config):
+    """一日予約の展開、利用日時と延長の解析、会議室IDの解決を行い (解析済みの行, 除外した行) を返す
+
+    行ごとに独立した処理のため、チャンクに分けて処理しても結果は変わらない
+    """
+    # Process "一日" / "午前・午後" bookings - split into one row per slot
+    datetime_col = (config or {}).get('csv_column_mapping', {}).get('booking_datetime', '利用日時(予約内容)')
+    df = expand_all_day_bookings(df, datetime_col)
+
+    df, rejected = add_date_slot_columns(df.copy(), config)
+    df = add_interval_columns(df.copy(), config)
+    return add_room_id_column(df, config), rejected
+
+def project_booking_columns(df, columns):
+    """取り込む列だけを残す（columns がNoneの場合はそのまま）"""
+    if columns is None:
+        return df
+    return df[[column for column in df.columns if column in columns]]
+
+# チャンクごとの取り込み結果（rows は読み込んだ行数、差分取り込みでは bookings 以外はNone）
+IngestChunk = namedtuple('IngestChunk', ['rows', 'bookings', 'rejected', 'cancelled', 'full_rows', 'row_hashes'])
+
+# 重複・取消の判定に使う、アップロード全体での元の行番号（保存前に削除）
+INGEST_ROW_COL = '_ingest_row'
+
+def read_booking_upload(csv_file, process_chunk, ingest_settings, booking_columns):
+    """アップロードされたCSVを chunk_rows 行ずつ読み込み、process_chunk の結果のリストと
+    エンコーディングを返す（全列を保管しない場合は取り込む列だけを読み込む）
+
+    チャンクごとに型が変わらないよう、値は文字列のまま読み込む（chunk_rows が0の場合も同じ）
+    """
+    read_options = {'dtype': str}
+    if booking_columns is not None and not ingest_settings['keep_full_rows']:
+        read_options['usecols'] = lambda column: column in booking_columns
+
+    chunk_rows = int(ingest_settings['chunk_rows'] or 0)
+    if chunk_rows <= 0:
+        df, encoding = read_csv_auto(csv_file, **read_options)
+        return [process_chunk(df)], encoding
+    return read_csv_chunks_auto(csv_file, process_chunk, chunk_rows, **read_options)
+
+def prepare_upload_chunk(chunk, source_file, config, ingest_settings, booking_columns):
+    """アップロードされたCSVの1チャンクを処理して IngestChunk を返す
+
+    行ごとに独立した処理だけを行い、重複・取消行の除外は combine_upload_chunks でまとめて行う
+    （元の行番号にはファイル内の行番号 chunk.index を付けておき、offset_ingest_chunk でずらす）。
+    差分取り込みでは申込NOごとに反映する行を決めてから処理するため、列の絞り込みだけを行う
+    """
+    chunk = chunk.fillna('')
+    chunk['source_file'] = source_file
+    full_rows = chunk if ingest_settings['keep_full_rows'] else None
+    chunk = project_booking_columns(chunk, booking_columns)
+    if ingest_settings['mode'] == 'upsert':
+        return IngestChunk(len(chunk), chunk, None, None, full_rows, None)
+
+    chunk = chunk.assign(**{INGEST_ROW_COL: chunk.index.to_numpy()})
+    row_hashes = get_booking_row_hashes(chunk, config)
+    bookings, cancelled = split_cancelled_bookings(chunk, config)
+    bookings, rejected = prepare_booking_rows(bookings, config)
+    return IngestChunk(len(chunk), bookings, rejected, cancelled, full_rows, row_hashes)
+
+def read_upload_file(csv_file, config, ingest_settings, booking_columns):
+    """1つのCSVファイルを読み込んで処理し、(チャンクごとの結果, エンコーディング) を返す
+
+    並列取り込みではワーカープロセスで実行するため、結果は IngestChunk ではなくタプルで返す
+    """
+    source_file = os.path.basename(csv_file)
+    chunks, encoding = read_booking_upload(
+        csv_file,
+        lambda chunk: prepare_upload_chunk(chunk, source_file, config, ingest_settings, booking_columns),
+        ingest_settings, booking_columns
+    )
+    return [tuple(chunk) for chunk in chunks], encoding
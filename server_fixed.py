@@ -1,11 +1,20 @@
 import pandas as pd
-from flask import Flask, jsonify, send_from_directory, request
+import numpy as np
+from flask import Flask, Response, jsonify, send_from_directory, request
 from werkzeug.utils import secure_filename
+from werkzeug.serving import WSGIRequestHandler
 import os
 import json
+import gzip
+import hashlib
 import logging
 import time
 import threading
+import unicodedata
+import uuid
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import glob
@@ -14,8 +23,18 @@ import pystray
 from PIL import Image, ImageDraw
 import sys
 import subprocess
+import sqlite3
+import selectors
+import socket
+from urllib.parse import urlsplit
 from datetime import datetime, timedelta
 import winreg  # Windows レジストリ操作
+from csv_encoding import read_csv_auto
+from ingest_worker import (
+    SLOT_IDS, IngestChunk, INGEST_ROW_COL, add_interval_columns, build_room_lookup, extract_booking_date_slot,
+    get_booking_row_hashes, normalize_booking_keys, normalize_room_name, parse_time_minutes, prepare_booking_rows,
+    project_booking_columns, read_upload_file, resolve_room_ids, split_cancelled_bookings
+)
 
 # Configure logging with rotation
 import logging.handlers
@@ -59,6 +78,15 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 UPLOADS_DIR = os.path.join(BASE_DIR, 'uploads')
 BOOKINGS_CSV = os.path.join(DATA_DIR, 'processed_bookings.csv')
+BOOKINGS_SNAPSHOT = os.path.join(DATA_DIR, 'processed_bookings.npz')
+# 利用日時を解析できず取り込まなかった行の一覧
+REJECTED_BOOKINGS_CSV = os.path.join(DATA_DIR, 'rejected_bookings.csv')
+# 同じ日・時間帯に重なっている予約の一覧
+BOOKING_CONFLICTS_JSON = os.path.join(DATA_DIR, 'booking_conflicts.json')
+# 取り消された予約の保管先（"ingest": {"keep_cancelled": true} の場合のみ）
+CANCELLED_BOOKINGS_CSV = os.path.join(DATA_DIR, 'cancelled_bookings.csv')
+# アップロードされたCSVの全列の保管先（"ingest": {"keep_full_rows": true} の場合のみ）
+FULL_BOOKINGS_CSV = os.path.join(DATA_DIR, 'full_bookings.csv')
 
 # セキュリティ設定
 ALLOWED_EXTENSIONS = {'csv'}
@@ -83,19 +111,16 @@ def validate_csv_content(file_path):
             logger.warning(f"File size too large: {file_size} bytes")
             return False, "ファイルサイズが大きすぎます（最大50MB）"
 
-        # CSV形式チェック（複数エンコーディング対応）
-        encodings = ['utf-8-sig', 'utf-8', 'cp932', 'shift_jis']
-        for encoding in encodings:
-            try:
-                df = pd.read_csv(file_path, encoding=encoding, nrows=1)
-                if len(df.columns) == 0:
-                    return False, "CSVファイルに列が見つかりません"
-                logger.info(f"CSV validation passed with encoding: {encoding}")
-                return True, "OK"
-            except Exception as e:
-                continue
-
-        return False, "CSVファイルの読み込みに失敗しました"
+        # CSV形式チェック（エンコーディングは先頭バイトから判定）
+        try:
+            df, encoding = read_csv_auto(file_path, nrows=1)
+        except Exception:
+            return False, "CSVファイルの読み込みに失敗しました"
+
+        if len(df.columns) == 0:
+            return False, "CSVファイルに列が見つかりません"
+        logger.info(f"CSV validation passed with encoding: {encoding}")
+        return True, "OK"
     except Exception as e:
         logger.error(f"CSV validation error: {e}")
         return False, f"ファイル検証エラー: {str(e)}"
@@ -164,8 +189,455 @@ def cleanup_old_processed_files():
     except Exception as e:
         logging.error(f"Error in cleanup_old_processed_files: {e}")
 
-def process_csv_files():
-    """uploadsフォルダ内のCSVファイルを処理して結合"""
+def fill_missing_derived_columns(bookings, config):
+    """取り込み時に作成する列が未設定の予約（旧形式のデータ・後から追加された会議室）にだけ値を設定"""
+    csv_column_mapping = (config or {}).get('csv_column_mapping', {})
+    room_col = csv_column_mapping.get('room_name', '会議室(予約内容)')
+    datetime_col = csv_column_mapping.get('booking_datetime', '利用日時(予約内容)')
+
+    missing_dates = [booking for booking in bookings if 'date' not in booking or 'slot' not in booking]
+    if missing_dates:
+        date_slot = extract_booking_date_slot([booking.get(datetime_col, '') for booking in missing_dates])
+        for booking, date, slot in zip(missing_dates, date_slot['date'], date_slot['slot']):
+            booking['date'] = date
+            booking['slot'] = slot
+
+    missing_intervals = [booking for booking in bookings if 'start_minute' not in booking or 'end_minute' not in booking]
+    if missing_intervals:
+        extension_col = csv_column_mapping.get('extension', '延長(予約内容)')
+        intervals = add_interval_columns(pd.DataFrame({
+            'slot': [booking['slot'] for booking in missing_intervals],
+            extension_col: [booking.get(extension_col, '') for booking in missing_intervals],
+        }), config)
+        for booking, start, end in zip(missing_intervals, intervals['start_minute'].tolist(), intervals['end_minute'].tolist()):
+            booking['start_minute'] = start
+            booking['end_minute'] = end
+
+    room_lookup = None
+    for booking in bookings:
+        if booking.get('room_id'):
+            continue
+        if room_lookup is None:
+            room_lookup = build_room_lookup(config)
+        name = str(booking.get(room_col, ''))
+        booking['room_id'] = room_lookup.get(name) or room_lookup.get(normalize_room_name(name), '')
+    return bookings
+
+def apply_data_split_rules(df, config):
+    """分割ルール（data_split_rules）のコピー元の予約を、コピー先の会議室の行として追加
+
+    追加した行の original_room_id にはコピー元の会議室IDを設定する（元の行は空文字）
+    """
+    room_col = (config or {}).get('csv_column_mapping', {}).get('room_name', '会議室(予約内容)')
+    rooms = {room.get('id'): room for room in (config or {}).get('rooms', [])}
+
+    pairs = []
+    for rule in (config or {}).get('data_split_rules', []):
+        if not rule.get('enabled'):
+            continue
+        for target_room_id in rule.get('target_room_ids', []):
+            if target_room_id in rooms:
+                pairs.append((rule.get('source_room_id'), target_room_id))
+            else:
+                logging.warning(f"Target room not found: {target_room_id}")
+
+    df['original_room_id'] = ''
+    if not pairs or df.empty:
+        return df
+
+    # (会議室ID, 行番号) とルールを結合し、コピーする行と会議室の組を求める
+    rules = pd.DataFrame(pairs, columns=['room_id', 'target_room_id'])
+    rules['rule_order'] = np.arange(len(rules))
+    targets = pd.DataFrame({'room_id': df['room_id'].to_numpy(), 'position': np.arange(len(df))}).merge(rules, on='room_id')
+    if targets.empty:
+        return df
+    targets = targets.sort_values(['rule_order', 'position'], kind='stable')
+
+    copies = df.iloc[targets['position'].to_numpy()].copy()
+    copies['room_id'] = targets['target_room_id'].to_numpy()
+    copies['original_room_id'] = targets['room_id'].to_numpy()
+    if room_col in copies.columns:
+        room_names = {room_id: room.get('csv_name') or room.get('display_name', '') for room_id, room in rooms.items()}
+        copies[room_col] = targets['target_room_id'].map(room_names).to_numpy()
+
+    logging.info(f"Applied {len(pairs)} split targets: {len(copies)} rows added")
+    return pd.concat([df, copies], ignore_index=True, sort=False)
+
+def write_reject_report(rejected):
+    """取り込まなかった行を rejected_bookings.csv に保存（なければ前回の一覧を削除）"""
+    if rejected.empty:
+        if os.path.exists(REJECTED_BOOKINGS_CSV):
+            os.remove(REJECTED_BOOKINGS_CSV)
+        return
+    rejected.to_csv(REJECTED_BOOKINGS_CSV, index=False, encoding='utf-8-sig')
+    logging.warning(f"{len(rejected)} rows could not be parsed and were skipped (see {REJECTED_BOOKINGS_CSV})")
+
+def get_room_units(config):
+    """会議室ID → 実際に使用する部屋（分割ルールのコピー元はコピー先の部屋すべて）"""
+    units = {}
+    for rule in (config or {}).get('data_split_rules', []):
+        if rule.get('enabled') and rule.get('target_room_ids'):
+            units.setdefault(rule.get('source_room_id'), set()).update(rule['target_room_ids'])
+    return units
+
+def detect_booking_conflicts(df, config):
+    """同じ日・時間帯に同じ部屋を使う別々の予約（申込NOが異なる）を求める
+
+    分割ルールのコピー元（ホール全体など）はコピー先の部屋すべてを使う予約として扱う
+    """
+    csv_column_mapping = (config or {}).get('csv_column_mapping', {})
+    key_col = csv_column_mapping.get('booking_id', '申込NO')
+    cancel_col = csv_column_mapping.get('cancellation_date', '取消日(予約内容)')
+    room_col = csv_column_mapping.get('room_name', '会議室(予約内容)')
+    display_col = csv_column_mapping.get('display_name', '案内表示名(予約内容)')
+    company_col = csv_column_mapping.get('company_name', '事業所名')
+
+    if df.empty or 'room_id' not in df.columns:
+        return []
+    df = df.reset_index(drop=True)
+    original = df['original_room_id'].astype(str).isin(['', 'nan']) if 'original_room_id' in df.columns else True
+    active = df[cancel_col].astype(str).str.strip().isin(['', 'nan']) if cancel_col in df.columns else True
+    rows = df[original & active & (df['room_id'].astype(str) != '')]
+    if rows.empty:
+        return []
+
+    # 申込NOがない行は他の行と別の予約として扱う
+    booking_nos = normalize_booking_keys(rows[key_col]) if key_col in rows.columns else pd.Series('', index=rows.index)
+    booking_nos = booking_nos.where(booking_nos != '', '#' + rows.index.astype(str))
+
+    # 予約 × 使用する部屋 の行に展開
+    room_units = get_room_units(config)
+    unit_table = pd.DataFrame(
+        [(room_id, unit) for room_id, units in room_units.items() for unit in sorted(units)],
+        columns=['room_id', 'unit']
+    )
+    cells = pd.DataFrame({
+        'position': rows.index.to_numpy(),
+        'date': rows['date'].astype(str).to_numpy(),
+        'slot': rows['slot'].astype(str).to_numpy(),
+        'room_id': rows['room_id'].astype(str).to_numpy(),
+        'booking_no': booking_nos.to_numpy(),
+    }).merge(unit_table, on='room_id', how='left')
+    cells['unit'] = cells['unit'].fillna(cells['room_id'])
+
+    # 同じ 日付・時間帯・部屋 に申込NOが2種類以上ある組が重複
+    distinct = cells.groupby(['date', 'slot', 'unit'])['booking_no'].transform('nunique')
+    collisions = cells[distinct.to_numpy() > 1].sort_values(['date', 'slot', 'unit', 'position'])
+    if collisions.empty:
+        return []
+
+    # 並べ替え済みの配列を組ごとに区切る（同じ予約の組が複数の部屋で重なる場合は1件にまとめる）
+    group_keys = collisions[['date', 'slot', 'unit']].to_numpy(dtype=object)
+    boundaries = np.flatnonzero((group_keys[1:] != group_keys[:-1]).any(axis=1)) + 1
+    conflicts = {}
+    for start, group_positions in zip(np.r_[0, boundaries], np.split(collisions['position'].to_numpy(), boundaries)):
+        date, slot, unit = group_keys[start]
+        positions = tuple(np.unique(group_positions).tolist())
+        conflict = conflicts.setdefault((date, slot, positions), {'date': date, 'slot': slot, 'rooms': [], 'positions': positions})
+        conflict['rooms'].append(unit)
+
+    def column_values(column):
+        return df[column].to_numpy(dtype=object) if column in df.columns else np.full(len(df), '', dtype=object)
+
+    key_values, room_ids, room_names = column_values(key_col), column_values('room_id'), column_values(room_col)
+    display_names, company_names = column_values(display_col), column_values(company_col)
+
+    result = []
+    for conflict in conflicts.values():
+        conflict['bookings'] = [{
+            'booking_no': _booking_key_part(key_values[position]),
+            'room_id': str(room_ids[position]),
+            'room_name': str(room_names[position]),
+            'display_name': str(display_names[position]),
+            'company_name': str(company_names[position]),
+        } for position in conflict.pop('positions')]
+        result.append(conflict)
+    return result
+
+def write_conflict_report(conflicts):
+    """重複している予約の一覧を booking_conflicts.json に保存"""
+    with open(BOOKING_CONFLICTS_JSON, 'w', encoding='utf-8') as f:
+        json.dump({'updated': time.strftime('%Y-%m-%d %H:%M:%S'), 'conflicts': conflicts}, f, ensure_ascii=False, indent=2)
+    if conflicts:
+        logging.warning(f"{len(conflicts)} booking conflicts found (see {BOOKING_CONFLICTS_JSON})")
+
+def load_conflict_report():
+    """重複している予約の一覧を読み込む（まだ作成されていなければ空の一覧）"""
+    try:
+        with open(BOOKING_CONFLICTS_JSON, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'updated': None, 'conflicts': []}
+
+def drop_duplicate_bookings(df, config):
+    """申込NO・利用日時・会議室が同じ行を1行にまとめる（後から読み込んだ行を残す）"""
+    hashes = get_booking_row_hashes(df, config)
+    duplicated = pd.Series(hashes).duplicated(keep='last').to_numpy() & (hashes != 0)
+    if duplicated.any():
+        logging.info(f"Removed {int(duplicated.sum())} duplicate rows")
+    return df[~duplicated]
+
+def archive_cancelled_bookings(cancelled, config):
+    """取り消された予約を cancelled_bookings.csv に追記（同じ行は最新の内容に置き換え）"""
+    if os.path.exists(CANCELLED_BOOKINGS_CSV):
+        existing, _ = read_csv_auto(CANCELLED_BOOKINGS_CSV)
+        cancelled = pd.concat([existing.fillna(''), cancelled], ignore_index=True, sort=False).fillna('')
+    cancelled = drop_duplicate_bookings(cancelled, config)
+    cancelled.to_csv(CANCELLED_BOOKINGS_CSV, index=False, encoding='utf-8-sig')
+    logging.info(f"Cancelled bookings archived: {len(cancelled)} rows ({CANCELLED_BOOKINGS_CSV})")
+
+def prepare_processed_bookings(df, config):
+    """保存前に重複・取消行の除外、一日予約の展開、利用日時と延長の解析、会議室IDの解決、分割ルールの適用を行う
+
+    以前に追加した分割行は作り直す。設定で参照していない列は取り除く
+    """
+    df = project_booking_columns(df, get_booking_columns(config))
+    if 'original_room_id' in df.columns:
+        df = df[df['original_room_id'].astype(str).isin(['', 'nan'])].drop(columns=['original_room_id'])
+
+    # 複数のCSVに同じ予約が含まれている場合の重複を除く（取消も後のファイルの内容を採用するため先に行う）
+    df = drop_duplicate_bookings(df, config)
+
+    # 取り消された予約はブラウザに送らない（設定により別ファイルに保管）
+    df, cancelled = split_cancelled_bookings(df, config)
+    if len(cancelled):
+        logging.info(f"Removed {len(cancelled)} cancelled rows")
+        if get_ingest_settings(config)['keep_cancelled']:
+            archive_cancelled_bookings(cancelled, config)
+
+    df, rejected = prepare_booking_rows(df, config)
+    write_reject_report(rejected)
+    return apply_data_split_rules(df, config)
+
+def save_processed_bookings(df, config):
+    """処理済み予約データをCSVと設定された保存先（スナップショット / SQLite）に保存"""
+    df.to_csv(BOOKINGS_CSV, index=False, encoding='utf-8-sig')
+    logging.info(f"Combined CSV saved: {len(df)} total rows")
+
+    # 保存したデータに対する重複予約の一覧を作成（失敗しても保存は続ける）
+    try:
+        write_conflict_report(detect_booking_conflicts(df, config))
+    except Exception as e:
+        logging.warning(f"Could not detect booking conflicts: {e}")
+
+    # 読み込み用のバイナリスナップショットも作成（失敗してもCSVは利用可能。差分取り込み・作り直しはSQLite保存時も使う）
+    try:
+        write_bookings_snapshot(df)
+    except Exception as e:
+        logging.warning(f"Could not write bookings snapshot: {e}")
+
+    storage_settings = get_storage_settings(config)
+    if storage_settings['backend'] == 'sqlite':
+        # SQLiteに保存（CSVは確認用として引き続き出力）
+        write_bookings_sqlite(df, config, get_bookings_db_path(storage_settings))
+
+def rebuild_processed_bookings():
+    """config.json の変更に合わせて保存済みデータの会議室ID・分割行を作り直す"""
+    config = load_config()
+    try:
+        if os.path.exists(BOOKINGS_CSV):
+            existing_df = read_processed_bookings().fillna('')
+            prepared_df = prepare_processed_bookings(existing_df, config)
+            # 会議室の対応・分割ルールに関係しない変更であれば保存し直さない
+            if not prepared_df.astype(str).reset_index(drop=True).equals(existing_df.astype(str).reset_index(drop=True)):
+                save_processed_bookings(prepared_df, config)
+                logging.info("Processed bookings rebuilt for the new config")
+    except Exception as e:
+        logging.error(f"Error rebuilding processed bookings: {e}")
+    return booking_cache.reload()
+
+# 取り込み設定のデフォルト値（config.json の "ingest" で上書き可能）
+# mode: "replace" = uploads内のファイルだけで作り直す / "upsert" = 申込NOをキーに既存データへ差分反映
+# keep_cancelled: 取り消された予約を cancelled_bookings.csv に保管するか
+# project_columns: 設定で参照している列だけを取り込むか / extra_columns: 追加で残す列
+# keep_full_rows: アップロードされたCSVの全列を full_bookings.csv に保管するか
+# chunk_rows: アップロードされたCSVを何行ずつ読み込むか（0 = ファイル全体を一度に読み込む）
+# workers: 複数のCSVを同時に読み込むプロセス数（1 = 順番に読み込む）
+DEFAULT_INGEST_SETTINGS = {
+    'mode': 'replace',
+    'keep_cancelled': False,
+    'project_columns': True,
+    'extra_columns': [],
+    'keep_full_rows': False,
+    'chunk_rows': 50000,
+    'workers': 1
+}
+
+def get_ingest_settings(config):
+    """取り込み設定を取得（未設定の項目はデフォルト値）"""
+    settings = dict(DEFAULT_INGEST_SETTINGS)
+    if config:
+        settings.update(config.get('ingest') or {})
+    return settings
+
+# カレンダー表示・サーバー側の処理で使う列（csv_column_mapping で変更されていない場合の列名）
+CALENDAR_COLUMNS = [
+    '申込NO', '利用日時(予約内容)', '会議室(予約内容)', '延長(予約内容)', '取消日(予約内容)',
+    '案内表示名(予約内容)', '事業所名', '担当者名', '支払額合計', '合計金額(予約内容)'
+]
+
+# 取り込み時に付け直す列
+DERIVED_COLUMNS = ['source_file', 'date', 'slot', 'start_minute', 'end_minute', 'room_id', 'original_room_id']
+
+def get_booking_columns(config):
+    """取り込む列名の集合を返す（列を絞り込まない設定の場合はNone）
+
+    csv_column_mapping・modal_fields・modal_fields_list・検索対象で参照している列と
+    カレンダーで使う列、ingest.extra_columns に指定した列を残す
+    """
+    ingest_settings = get_ingest_settings(config)
+    if not ingest_settings['project_columns']:
+        return None
+
+    csv_column_mapping = (config or {}).get('csv_column_mapping', {})
+    columns = set(CALENDAR_COLUMNS) | set(DERIVED_COLUMNS)
+    columns.update(csv_column_mapping.values())
+    columns.update(csv_column_mapping.get(key, default_col) for key, default_col, _ in SEARCH_FIELDS)
+    columns.update((config or {}).get('modal_fields', {}).values())
+    for field in (config or {}).get('modal_fields_list') or []:
+        csv_field = field.get('csv_field', '')
+        # csv_field には列名と csv_column_mapping のキーのどちらも指定できる
+        columns.update([csv_field, csv_column_mapping.get(csv_field, csv_field)])
+    columns.update(ingest_settings['extra_columns'] or [])
+    columns.discard('')
+    return columns
+
+def offset_ingest_chunk(chunk, row_offset):
+    """ファイル内の行番号を、アップロード全体での行番号にずらす"""
+    if chunk.row_hashes is None or row_offset == 0:
+        return chunk
+    return chunk._replace(**{
+        field: getattr(chunk, field).assign(**{INGEST_ROW_COL: getattr(chunk, field)[INGEST_ROW_COL] + row_offset})
+        for field in ('bookings', 'rejected', 'cancelled')
+    })
+
+def get_ingest_workers(ingest_settings, file_count):
+    """同時に読み込むプロセス数（ファイル数より多くはしない）"""
+    try:
+        workers = int(ingest_settings['workers'] or 1)
+    except (TypeError, ValueError):
+        logging.warning(f"Invalid ingest workers setting: {ingest_settings['workers']}")
+        workers = 1
+    return max(1, min(workers, file_count))
+
+def combine_upload_chunks(chunks, config):
+    """チャンクごとに処理した予約を結合し、重複・取消行の除外と分割ルールの適用を行う
+
+    結果は全体を一度に prepare_processed_bookings で処理した場合と同じ
+    （同じ予約は最後に読み込んだ行だけを残し、その行が取り消されていれば除外する）
+    """
+    if not chunks:
+        return apply_data_split_rules(pd.DataFrame(), config)
+
+    row_hashes = np.concatenate([chunk.row_hashes for chunk in chunks])
+    latest = ~(pd.Series(row_hashes).duplicated(keep='last').to_numpy() & (row_hashes != 0))
+    if not latest.all():
+        logging.info(f"Removed {int((~latest).sum())} duplicate rows")
+
+    def combine(field):
+        # チャンクごとに絞り込んでから結合する（結合前の全行を同時に持たない）
+        frames = []
+        for chunk in chunks:
+            frame = getattr(chunk, field)
+            frames.append(frame[latest[frame[INGEST_ROW_COL].to_numpy(dtype=int)]].drop(columns=[INGEST_ROW_COL]))
+        return pd.concat(frames, ignore_index=True, sort=False).fillna('')
+
+    cancelled = combine('cancelled')
+    if len(cancelled):
+        logging.info(f"Removed {len(cancelled)} cancelled rows")
+        if get_ingest_settings(config)['keep_cancelled']:
+            archive_cancelled_bookings(cancelled, config)
+
+    write_reject_report(combine('rejected'))
+    return apply_data_split_rules(combine('bookings'), config)
+
+def archive_full_bookings(full_df, config):
+    """アップロードされたCSVの全列を full_bookings.csv に保存（差分取り込みでは既存の保管分に追記）"""
+    if get_ingest_settings(config)['mode'] == 'upsert' and os.path.exists(FULL_BOOKINGS_CSV):
+        existing, _ = read_csv_auto(FULL_BOOKINGS_CSV)
+        full_df = pd.concat([existing.fillna(''), full_df], ignore_index=True, sort=False).fillna('')
+    full_df = drop_duplicate_bookings(full_df, config)
+    full_df.to_csv(FULL_BOOKINGS_CSV, index=False, encoding='utf-8-sig')
+    logging.info(f"Full booking rows archived: {len(full_df)} rows ({FULL_BOOKINGS_CSV})")
+
+def select_upsert_rows(existing_df, delta_df, key_col, cancel_col):
+    """差分の反映内容を求めて (残す既存行のマスク, 反映する差分の行, 取消日のある差分の行, 件数) を返す"""
+    stats = {'inserted': 0, 'updated': 0, 'cancelled': 0, 'removed_rows': 0}
+
+    if key_col not in delta_df.columns:
+        logging.warning(f"Key column not found in upload: {key_col} (rows appended)")
+        stats['inserted'] = len(delta_df)
+        return np.ones(len(existing_df), dtype=bool), delta_df, delta_df.iloc[0:0], stats
+
+    delta_keys = normalize_booking_keys(delta_df[key_col]).to_numpy()
+    has_key = delta_keys != ''
+
+    # 同じ申込NOが複数ファイルにある場合は後のファイルの内容を採用
+    if 'source_file' in delta_df.columns and has_key.any():
+        last_source = delta_df['source_file'].groupby(delta_keys).transform('last')
+        latest = (delta_df['source_file'] == last_source).to_numpy() | ~has_key
+        delta_df = delta_df[latest]
+        delta_keys = delta_keys[latest]
+        has_key = has_key[latest]
+
+    if cancel_col in delta_df.columns:
+        cancelled = delta_df[cancel_col].astype(str).str.strip().ne('').to_numpy()
+    else:
+        cancelled = np.zeros(len(delta_df), dtype=bool)
+
+    if key_col in existing_df.columns:
+        existing_keys = normalize_booking_keys(existing_df[key_col]).to_numpy()
+    else:
+        existing_keys = np.array([''] * len(existing_df), dtype=object)
+
+    touched_keys = pd.unique(delta_keys[has_key])
+    replaced = np.isin(existing_keys, touched_keys) & (existing_keys != '')
+    existing_key_set = set(existing_keys[replaced])
+    live_keys = set(delta_keys[has_key & ~cancelled])
+
+    for key in touched_keys:
+        if key in live_keys:
+            stats['updated' if key in existing_key_set else 'inserted'] += 1
+        elif key in existing_key_set:
+            stats['cancelled'] += 1
+    stats['inserted'] += int((~has_key & ~cancelled).sum())
+    stats['removed_rows'] = int(replaced.sum())
+    return ~replaced, delta_df[~cancelled], delta_df[cancelled], stats
+
+def upsert_bookings(existing_df, delta_df, key_col, cancel_col):
+    """申込NOをキーに差分データを既存データへ反映し (結合結果, 件数, 取消日のある差分の行) を返す
+
+    差分に含まれる申込NOの既存行はすべて差分の行で置き換える。
+    取消日が入っている行は反映せず、その予約は既存データからも削除される。
+    """
+    keep, live_df, cancelled_df, stats = select_upsert_rows(existing_df, delta_df, key_col, cancel_col)
+    merged_df = pd.concat([existing_df[keep], live_df], ignore_index=True, sort=False)
+    return merged_df.fillna(''), stats, cancelled_df
+
+def upsert_processed_bookings(existing_df, delta_df, config):
+    """差分の行だけを取り込み処理してから保存済みデータへ申込NO単位で反映し (結合結果, 件数, 取消日のある差分の行) を返す
+
+    保存済みの行は処理済みのためそのまま使い、分割ルールも反映する差分の行だけに適用する
+    （置き換える申込NOの分割行は元の行と同じ申込NOのため一緒に削除される）
+    """
+    csv_column_mapping = (config or {}).get('csv_column_mapping', {})
+    key_col = csv_column_mapping.get('booking_id', '申込NO')
+    cancel_col = csv_column_mapping.get('cancellation_date', '取消日(予約内容)')
+
+    delta_df = drop_duplicate_bookings(project_booking_columns(delta_df, get_booking_columns(config)), config)
+    keep, live_df, cancelled_df, stats = select_upsert_rows(existing_df, delta_df, key_col, cancel_col)
+
+    live_df, rejected = prepare_booking_rows(live_df, config)
+    write_reject_report(rejected)
+    live_df = apply_data_split_rules(live_df, config)
+
+    merged_df = pd.concat([existing_df[keep], live_df], ignore_index=True, sort=False)
+    return merged_df.fillna(''), stats, cancelled_df
+
+def process_csv_files(job=None):
+    """uploadsフォルダ内のCSVファイルを処理して結合（job に進捗を記録）"""
+    if job is None:
+        job = IngestJob()
     try:
         # 古い処理済みファイルを削除
         cleanup_old_processed_files()
@@ -175,73 +647,115 @@ def process_csv_files():
         os.makedirs(UPLOADS_DIR, exist_ok=True)
 
         # Find all CSV files in uploads directory
-        csv_files = glob.glob(os.path.join(UPLOADS_DIR, '*.csv'))
+        # 同じ予約は後のファイルの内容を採用するため、ファイル名順に処理する
+        csv_files = sorted(glob.glob(os.path.join(UPLOADS_DIR, '*.csv')))
+
+        # 書き込み中のファイルは書き込みが終わってから取り込む
+        writing_files = [csv_file for csv_file in csv_files if upload_tracker.is_pending(csv_file)]
+        if writing_files:
+            logging.info(f"Skipping {len(writing_files)} files still being written")
+            csv_files = [csv_file for csv_file in csv_files if csv_file not in writing_files]
 
         if not csv_files:
             logging.info("No CSV files found in uploads directory")
             return False
 
         logging.info(f"Found {len(csv_files)} CSV files to process")
+        job.set_stage('reading')
 
-        combined_data = []
+        chunks = []
         processed_files = []
+        row_count = 0
 
-        for csv_file in csv_files:
+        # 設定で参照している列だけを、チャンク単位で読み込みながら処理する
+        config = load_config()
+        ingest_settings = get_ingest_settings(config)
+        booking_columns = get_booking_columns(config)
+
+        # 複数のファイルはワーカープロセスで同時に読み込み、結果はファイル名順に結合する
+        workers = get_ingest_workers(ingest_settings, len(csv_files))
+        executor = None
+        futures = []
+        if workers > 1:
             try:
-                # Try multiple encodings for Japanese CSV files
-                df = None
-                for encoding in ['utf-8-sig', 'cp932', 'shift_jis', 'utf-8', 'iso-2022-jp']:
-                    try:
-                        df = pd.read_csv(csv_file, encoding=encoding)
-                        logging.info(f"Successfully read {os.path.basename(csv_file)} with encoding: {encoding}")
-                        break
-                    except UnicodeDecodeError:
-                        continue
-
-                if df is not None:
-                    # Add source file information
-                    df['source_file'] = os.path.basename(csv_file)
-                    combined_data.append(df)
-                    processed_files.append(csv_file)
-                    logging.info(f"Processed: {os.path.basename(csv_file)} ({len(df)} rows)")
-                else:
-                    logging.error(f"Could not read {csv_file} with any encoding")
-
+                executor = ProcessPoolExecutor(max_workers=workers)
+                futures = [executor.submit(read_upload_file, csv_file, config, ingest_settings, booking_columns) for csv_file in csv_files]
+                logging.info(f"Reading {len(csv_files)} files with {workers} worker processes")
             except Exception as e:
-                logging.error(f"Error processing {csv_file}: {e}")
-
-        if combined_data:
-            # Combine all dataframes
-            combined_df = pd.concat(combined_data, ignore_index=True, sort=False)
+                logging.warning(f"Could not start worker processes, reading files one by one: {e}")
+                futures = []
 
-            # Fill NaN values with empty strings
-            combined_df = combined_df.fillna('')
+        try:
+            for index, csv_file in enumerate(csv_files):
+                try:
+                    # Detect the encoding once and parse the file a single time
+                    file_chunks = None
+                    source_file = os.path.basename(csv_file)
+                    try:
+                        try:
+                            values, encoding = futures[index].result() if futures else read_upload_file(csv_file, config, ingest_settings, booking_columns)
+                        except BrokenProcessPool as e:
+                            logging.warning(f"Worker process failed, reading {source_file} in this process: {e}")
+                            values, encoding = read_upload_file(csv_file, config, ingest_settings, booking_columns)
+                        file_chunks = [offset_ingest_chunk(IngestChunk(*value), row_count) for value in values]
+                        logging.info(f"Successfully read {source_file} with encoding: {encoding}")
+                    except UnicodeDecodeError:
+                        pass
+
+                    if file_chunks is not None:
+                        file_rows = sum(chunk.rows for chunk in file_chunks)
+                        chunks.extend(file_chunks)
+                        row_count += file_rows
+                        job.add_rows(file_rows)
+                        processed_files.append(csv_file)
+                        logging.info(f"Processed: {source_file} ({file_rows} rows)")
+                    else:
+                        logging.error(f"Could not read {csv_file} with any encoding")
+                        job.add_error(f"{source_file}: 文字コードを判定できませんでした")
 
-            # Process "一日" bookings - split into 午前, 午後, 夜間
-            processed_rows = []
-            config = load_config()
-            csv_column_mapping = config.get('csv_column_mapping', {}) if config else {}
-            datetime_col = csv_column_mapping.get('booking_datetime', '利用日時(予約内容)')
-
-            for index, row in combined_df.iterrows():
-                datetime_value = str(row.get(datetime_col, ''))
-                if '一日' in datetime_value:
-                    # Split "一日" into three time slots
-                    base_datetime = datetime_value.replace('一日', '')
-                    for time_slot in ['午前', '午後', '夜間']:
-                        new_row = row.copy()
-                        new_row[datetime_col] = base_datetime + time_slot
-                        processed_rows.append(new_row)
-                else:
-                    processed_rows.append(row)
+                except Exception as e:
+                    logging.error(f"Error processing {csv_file}: {e}")
+                    job.add_error(f"{os.path.basename(csv_file)}: {e}")
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
 
-            # Create new dataframe with processed rows
-            if processed_rows:
-                combined_df = pd.DataFrame(processed_rows)
+        if processed_files:
+            job.set_stage('preparing')
+            full_data = [chunk.full_rows for chunk in chunks if chunk.full_rows is not None]
+            if full_data:
+                try:
+                    archive_full_bookings(pd.concat(full_data, ignore_index=True, sort=False).fillna(''), config)
+                except Exception as e:
+                    logging.warning(f"Could not archive full booking rows: {e}")
+            del full_data
+
+            if ingest_settings['mode'] == 'upsert':
+                # Combine all dataframes
+                combined_df = pd.concat([chunk.bookings for chunk in chunks], ignore_index=True, sort=False).fillna('')
+
+                # 差分取り込みモードでは差分の行だけを処理して既存データに申込NO単位で反映
+                # （会議室IDの解決と分割ルールの適用も差分の行だけに行う）
+                existing_df = read_processed_bookings().fillna('') if os.path.exists(BOOKINGS_CSV) else pd.DataFrame()
+                combined_df, upsert_stats, cancelled_df = upsert_processed_bookings(existing_df, combined_df, config)
+                logging.info(
+                    f"Upsert applied: {upsert_stats['inserted']} inserted, {upsert_stats['updated']} updated, "
+                    f"{upsert_stats['cancelled']} cancelled ({upsert_stats['removed_rows']} old rows replaced)"
+                )
+                # 取り消された予約は反映時に除かれるため、ここで保管する
+                if len(cancelled_df):
+                    logging.info(f"Removed {len(cancelled_df)} cancelled rows")
+                    if ingest_settings['keep_cancelled']:
+                        archive_cancelled_bookings(cancelled_df, config)
+            else:
+                # チャンクごとに処理済みの行を結合し、重複・取消行の除外と分割ルールの適用を行う
+                combined_df = combine_upload_chunks(chunks, config)
+            # 保存前に読み込み時のデータを解放しておく
+            del chunks
 
             # Save combined data
-            combined_df.to_csv(BOOKINGS_CSV, index=False, encoding='utf-8-sig')
-            logging.info(f"Combined CSV saved: {len(combined_df)} total rows")
+            job.set_stage('saving')
+            save_processed_bookings(combined_df, config)
 
             # Move processed files to processed folder
             processed_dir = os.path.join(BASE_DIR, 'processed')
@@ -259,6 +773,16 @@ def process_csv_files():
                 except Exception as e:
                     logging.error(f"Error moving {file_path}: {e}")
 
+            # 新しいデータを次の世代としてキャッシュに反映し、検索インデックス・空き状況も作成しておく
+            job.set_stage('indexing')
+            entry = booking_cache.reload()
+            try:
+                get_search_index(entry)
+                get_occupancy_index(entry)
+            except Exception as e:
+                # 作成できなかった場合は最初の問い合わせ時に作り直す
+                logging.warning(f"Could not build indexes: {e}")
+
             return True
         else:
             logging.warning("No CSV files could be processed")
@@ -266,33 +790,408 @@ def process_csv_files():
 
     except Exception as e:
         logging.error(f"Error in process_csv_files: {e}")
+        job.add_error(str(e))
         return False
 
-class UploadHandler(FileSystemEventHandler):
-    """ファイルアップロードを監視するハンドラー"""
+# --- 取り込みジョブ ---
+
+# 状態を保持するジョブ数（超えた場合は終了したジョブから古い順に削除）
+MAX_INGEST_JOBS = 50
+
+class IngestJob:
+    """1回の取り込みの進捗（段階・読み込んだ行数・エラー）"""
+
+    def __init__(self, files=()):
+        self.id = uuid.uuid4().hex
+        self.files = list(files)
+        self.status = 'queued'  # queued / running / succeeded / failed
+        self.stage = 'queued'   # queued / reading / preparing / saving / indexing / done
+        self.rows = 0
+        self.errors = []
+        self.message = ''
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    def start(self):
+        with self._lock:
+            self.status = 'running'
+            self.started = time.time()
+
+    def set_stage(self, stage):
+        with self._lock:
+            self.stage = stage
+
+    def add_rows(self, rows):
+        with self._lock:
+            self.rows += rows
+
+    def add_error(self, message):
+        with self._lock:
+            self.errors.append(message)
+
+    def finish(self, success, message):
+        with self._lock:
+            self.status = 'succeeded' if success else 'failed'
+            self.stage = 'done'
+            self.message = message
+            self.finished = time.time()
+
+    def to_dict(self):
+        """/api/jobs/<id> の応答（処理速度は読み込んだ行数 / 経過秒数）"""
+        with self._lock:
+            elapsed = ((self.finished or time.time()) - self.started) if self.started else 0
+            return {
+                'id': self.id,
+                'status': self.status,
+                'stage': self.stage,
+                'files': list(self.files),
+                'rows': self.rows,
+                'elapsed_seconds': round(elapsed, 3),
+                'rows_per_sec': round(self.rows / elapsed, 1) if elapsed > 0 else 0,
+                'errors': list(self.errors),
+                'message': self.message,
+                'created': datetime.fromtimestamp(self.created).isoformat(timespec='seconds'),
+            }
+
+class IngestJobGroup:
+    """同じ取り込みにまとめられたジョブ（進捗をすべてのジョブに記録する）"""
+
+    def __init__(self, jobs):
+        self.jobs = list(jobs)
+        self.errors = []
+
+    def set_stage(self, stage):
+        for job in self.jobs:
+            job.set_stage(stage)
+
+    def add_rows(self, rows):
+        for job in self.jobs:
+            job.add_rows(rows)
+
+    def add_error(self, message):
+        self.errors.append(message)
+        for job in self.jobs:
+            job.add_error(message)
+
+# 最後の取り込み要求からこの秒数だけ新しい要求がなければ取り込みを始める（続けて届いた要求をまとめる）
+INGEST_DEBOUNCE_SECONDS = 0.5
+# 要求が続いても、最初の要求からこの秒数が過ぎたら取り込みを始める
+INGEST_MAX_DELAY_SECONDS = 10.0
+
+class IngestCoordinator:
+    """processed_bookings.csv を書き換える処理（取り込み・設定変更による作り直し）を1つのスレッドだけで行う
+
+    待機中・実行中に届いた要求はフラグにまとめ、実行後に多くても1回だけ続けて実行する
+    """
+
+    def __init__(self, debounce_seconds=INGEST_DEBOUNCE_SECONDS, max_delay_seconds=INGEST_MAX_DELAY_SECONDS, max_jobs=MAX_INGEST_JOBS):
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.max_jobs = max_jobs
+        self._condition = threading.Condition()
+        self._jobs = {}          # {ジョブID: IngestJob}（登録順）
+        self._pending_jobs = []  # 次の取り込みで処理するジョブ
+        self._ingest_requested = False
+        self._rebuild_requested = False
+        self._first_request = None
+        self._last_request = None
+        self._running = False
+        self._thread = None
+        self.run_count = 0
+
+    @property
+    def running(self):
+        return self._running
+
+    def submit(self, files):
+        """アップロードされたファイルの取り込みジョブを登録して返す（処理はバックグラウンドで行う）"""
+        job = IngestJob(files)
+        self._request(job=job)
+        logging.info(f"Ingest job queued: {job.id} ({len(job.files)} files)")
+        return job
+
+    def request_ingest(self):
+        """uploadsフォルダの取り込みを要求（ファイル監視から）"""
+        self._request()
+
+    def request_rebuild(self):
+        """設定変更に合わせた保存済みデータの作り直しを要求"""
+        self._request(rebuild=True)
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def _request(self, job=None, rebuild=False):
+        with self._condition:
+            if job is not None:
+                self._jobs[job.id] = job
+                finished = [job_id for job_id, old_job in self._jobs.items() if old_job.done]
+                for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+                    del self._jobs[job_id]
+                self._pending_jobs.append(job)
+            if rebuild:
+                self._rebuild_requested = True
+            else:
+                self._ingest_requested = True
+
+            now = time.monotonic()
+            if self._first_request is None:
+                self._first_request = now
+            self._last_request = now
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ingest-coordinator', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def _wait_for_requests(self):
+        """要求が届き、debounce_seconds 秒間新しい要求がなくなるまで待って、まとめた要求を取り出す"""
+        with self._condition:
+            while True:
+                if not (self._ingest_requested or self._rebuild_requested):
+                    self._condition.wait()
+                    continue
+                start_at = min(self._last_request + self.debounce_seconds, self._first_request + self.max_delay_seconds)
+                remaining = start_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            jobs, self._pending_jobs = self._pending_jobs, []
+            ingest, rebuild = self._ingest_requested, self._rebuild_requested
+            self._ingest_requested = self._rebuild_requested = False
+            self._first_request = self._last_request = None
+            self._running = True
+            return jobs, ingest, rebuild
+
+    def _run(self):
+        while True:
+            jobs, ingest, rebuild = self._wait_for_requests()
+            try:
+                self._execute(jobs, ingest, rebuild)
+            except Exception as e:
+                logging.error(f"Ingest coordinator error: {e}")
+            finally:
+                with self._condition:
+                    self._running = False
+                    self.run_count += 1
+
+    def _execute(self, jobs, ingest, rebuild):
+        group = IngestJobGroup(jobs)
+        for job in jobs:
+            job.start()
+
+        success = False
+        if ingest:
+            try:
+                success = process_csv_files(group)
+            except Exception as e:
+                logging.error(f"Ingest failed: {e}")
+                group.add_error(str(e))
+        # 取り込んだ場合は最新の設定で作り直し済み
+        if rebuild and not success:
+            rebuild_processed_bookings()
+
+        if success:
+            message = "CSVファイルが正常に処理されました"
+            conflict_count = len(load_conflict_report()['conflicts'])
+            if conflict_count:
+                message += f"（重複している予約が{conflict_count}件あります）"
+        elif not group.errors:
+            message = "処理するファイルがありませんでした"
+        else:
+            message = "CSVファイルの処理中にエラーが発生しました"
+        for job in jobs:
+            if not success and not group.errors and job.files and not any(
+                    os.path.exists(os.path.join(UPLOADS_DIR, filename)) for filename in job.files):
+                # 実行中の取り込みにファイルが含まれていた場合は、その取り込みで処理済み
+                job.finish(True, "CSVファイルは直前の取り込みで処理されました")
+            else:
+                job.finish(success, message)
+        logging.info(f"Ingest run finished: {'succeeded' if success else 'nothing ingested'} ({len(jobs)} jobs)")
+
+ingest_coordinator = IngestCoordinator()
+
+# サイズ・更新時刻がこの秒数変わらなければ、uploads のファイルの書き込みが終わったとみなす
+UPLOAD_STABLE_SECONDS = 1.0
+# 書き込み中のファイルを確認する間隔（変化が続くファイルほど長くする）
+UPLOAD_POLL_MIN_SECONDS = 0.25
+UPLOAD_POLL_MAX_SECONDS = 2.0
+
+class UploadFileTracker:
+    """uploadsフォルダで書き込み中のCSVを追跡し、書き込みが終わったら取り込みを要求する
+
+    ファイル監視のイベントでは記録だけを行い、サイズ・更新時刻の確認は専用のスレッドで行う
+    """
 
     def __init__(self):
-        self.last_processed = {}
+        self._condition = threading.Condition()
+        self._pending = {}    # {パス: {'signature', 'changed', 'interval', 'next_check'}}
+        self._completed = {}  # {パス: (サイズ, 更新時刻)} 書き込みが終わっているファイル
+        self._thread = None
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path)
+            return (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return None
+
+    def track(self, path):
+        """作成・更新されたファイルを書き込み中として記録（ファイルの確認は専用のスレッドで行う）"""
+        key = self._key(path)
+        now = time.monotonic()
+        with self._condition:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = {'signature': None, 'interval': UPLOAD_POLL_MIN_SECONDS}
+            entry['changed'] = now
+            entry['next_check'] = now + entry['interval']
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='upload-tracker', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def mark_complete(self, path):
+        """書き込みが終わっているファイルを記録（Webからのアップロードで保存したファイルなど）"""
+        key = self._key(path)
+        signature = self._signature(key)
+        with self._condition:
+            self._pending.pop(key, None)
+            if signature is not None:
+                self._completed[key] = signature
+
+    def forget(self, path):
+        """削除・移動されたファイルの記録を消す"""
+        key = self._key(path)
+        with self._condition:
+            self._pending.pop(key, None)
+            self._completed.pop(key, None)
+
+    def is_pending(self, path):
+        """書き込み中のファイルか（書き込みが終わったと記録した後に変更されていなければFalse）"""
+        key = self._key(path)
+        with self._condition:
+            if key not in self._pending:
+                return False
+            completed = self._completed.get(key)
+        return completed is None or completed != self._signature(key)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                wait = min(entry['next_check'] for entry in self._pending.values()) - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                now = time.monotonic()
+                due = [key for key, entry in self._pending.items() if entry['next_check'] <= now]
+
+            # ネットワークドライブでは時間がかかることがあるため、ロックの外で確認する
+            signatures = {key: self._signature(key) for key in due}
+
+            completed = []
+            with self._condition:
+                now = time.monotonic()
+                for key, signature in signatures.items():
+                    entry = self._pending.get(key)
+                    if entry is None:
+                        continue
+                    if signature is None or self._completed.get(key) == signature:
+                        # 削除・移動されたファイルと、書き込みが終わっているファイル（Webからのアップロード）
+                        del self._pending[key]
+                        continue
+                    if entry['signature'] is None:
+                        logging.info(f"New CSV file detected: {os.path.basename(key)}")
+                        entry['signature'] = signature
+                    elif signature != entry['signature']:
+                        # 書き込みが続いている
+                        entry.update(signature=signature, changed=now, interval=min(entry['interval'] * 2, UPLOAD_POLL_MAX_SECONDS))
+                    elif signature[0] > 0 and now - entry['changed'] >= UPLOAD_STABLE_SECONDS:
+                        del self._pending[key]
+                        self._completed[key] = signature
+                        completed.append(key)
+                        continue
+                    entry['next_check'] = now + entry['interval']
+
+            if completed:
+                logging.info(f"CSV files ready: {', '.join(os.path.basename(key) for key in completed)}")
+                ingest_coordinator.request_ingest()
+
+upload_tracker = UploadFileTracker()
+
+class UploadHandler(FileSystemEventHandler):
+    """uploadsフォルダのCSVの作成・更新・移動を upload_tracker に伝える（監視スレッドでは待機しない）"""
+
+    @staticmethod
+    def _is_upload_csv(path):
+        return path.lower().endswith('.csv') and os.path.normcase(os.path.dirname(os.path.abspath(path))) == os.path.normcase(os.path.abspath(UPLOADS_DIR))
 
     def on_created(self, event):
-        if not event.is_directory and event.src_path.endswith('.csv'):
-            # Avoid duplicate processing
-            current_time = time.time()
-            if event.src_path in self.last_processed:
-                if current_time - self.last_processed[event.src_path] < 5:  # 5 second cooldown
-                    return
-
-            self.last_processed[event.src_path] = current_time
-            logging.info(f"New CSV file detected: {os.path.basename(event.src_path)}")
-
-            # Wait a moment for file to be completely written
-            time.sleep(2)
-
-            # Process CSV files
-            if process_csv_files():
-                logging.info("CSV processing completed successfully")
-            else:
-                logging.error("CSV processing failed")
+        if not event.is_directory and self._is_upload_csv(event.src_path):
+            upload_tracker.track(event.src_path)
+
+    def on_modified(self, event):
+        self.on_created(event)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            return
+        upload_tracker.forget(event.src_path)
+        # 一時ファイルに書き込んでから .csv に名前を変更する場合
+        if self._is_upload_csv(event.dest_path):
+            upload_tracker.track(event.dest_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            upload_tracker.forget(event.src_path)
+
+class ConfigFileHandler(FileSystemEventHandler):
+    """config.json の変更を監視し、接続中のクライアントに通知するハンドラー"""
+
+    def __init__(self):
+        self.last_signature = self._signature()
+
+    def _signature(self):
+        try:
+            stat = os.stat(os.path.join(BASE_DIR, 'config.json'))
+            return (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return None
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        paths = [event.src_path, getattr(event, 'dest_path', '')]
+        if not any(os.path.basename(path) == 'config.json' for path in paths if path):
+            return
+
+        # エディタの保存で複数回イベントが発生するため、内容が変わった場合のみ通知
+        signature = self._signature()
+        if signature is None or signature == self.last_signature:
+            return
+        self.last_signature = signature
+
+        logging.info("config.json changed")
+        event_broadcaster.publish('config', {'instance': booking_cache.instance_id})
+        # 会議室の対応・分割ルールが変わった場合は保存済みデータを作り直してから読み直す（取り込みと同じスレッドで行う）
+        ingest_coordinator.request_rebuild()
 
 def start_file_watcher():
     """ファイル監視を開始"""
@@ -302,6 +1201,7 @@ def start_file_watcher():
         event_handler = UploadHandler()
         observer = Observer()
         observer.schedule(event_handler, UPLOADS_DIR, recursive=False)
+        observer.schedule(ConfigFileHandler(), BASE_DIR, recursive=False)
         observer.start()
 
         logging.info(f"File watcher started for: {UPLOADS_DIR}")
@@ -311,25 +1211,260 @@ def start_file_watcher():
         logging.error(f"Error starting file watcher: {e}")
         return None
 
+# --- 予約データのスナップショット（列指向バイナリ形式） ---
+# processed_bookings.csv と同じ内容を列ごとのNumPy配列で保存する。
+# 文字列の列は「値の一覧 + 各行の番号」に辞書圧縮し、読み込み時にテキストを解析しない。
+
+def infer_csv_column(values):
+    """CSVに書いて読み直した場合と同じ型に列を変換し (種別, 変換後の列) を返す
+
+    種別は 'int' / 'float'（空欄はNaN） / 'str'
+    """
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return 'str', values.astype(str).astype(object)
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return 'int', values.astype(np.int64)
+    if pd.api.types.is_float_dtype(values.dtype):
+        return 'float', values.astype(np.float64)
+
+    empty = values.astype(str).eq('').to_numpy()
+    if not empty.all():
+        try:
+            numbers = pd.to_numeric(values[~empty])
+        except (ValueError, TypeError):
+            numbers = None
+        if numbers is not None and not pd.api.types.is_bool_dtype(numbers.dtype):
+            if pd.api.types.is_integer_dtype(numbers.dtype) and not empty.any():
+                return 'int', pd.Series(numbers.to_numpy(dtype=np.int64), index=values.index)
+            floats = np.full(len(values), np.nan)
+            floats[~empty] = numbers.to_numpy(dtype=np.float64)
+            return 'float', pd.Series(floats, index=values.index)
+
+    return 'str', values.astype(str).astype(object)
+
+def _encode_snapshot_column(values):
+    """1列をスナップショット用に変換し (種別, 配列の辞書) を返す"""
+    kind, converted = infer_csv_column(values)
+    if kind == 'int':
+        return kind, {'values': converted.to_numpy(dtype=np.int64)}
+    if kind == 'float':
+        return kind, {'values': converted.to_numpy(dtype=np.float64)}
+    return kind, _encode_snapshot_strings(converted)
+
+def _encode_snapshot_strings(values):
+    """文字列の列を辞書圧縮（値の一覧と各行の番号）"""
+    codes, uniques = pd.factorize(values.to_numpy(dtype=object))
+    return {
+        'codes': codes.astype(np.int32),
+        'categories': np.array(list(uniques), dtype=str)
+    }
+
+def write_bookings_snapshot(df, snapshot_path=None, csv_path=None):
+    """予約データのスナップショットを書き出す（元CSVのサイズ・更新時刻も記録）"""
+    snapshot_path = snapshot_path or BOOKINGS_SNAPSHOT
+    csv_path = csv_path or BOOKINGS_CSV
+
+    arrays = {}
+    kinds = []
+    for i, column in enumerate(df.columns):
+        kind, column_arrays = _encode_snapshot_column(df[column])
+        kinds.append(kind)
+        for name, array in column_arrays.items():
+            arrays[f"col{i}_{name}"] = array
+
+    csv_stat = os.stat(csv_path)
+    arrays['meta_columns'] = np.array([str(c) for c in df.columns], dtype=str)
+    arrays['meta_kinds'] = np.array(kinds, dtype=str)
+    arrays['meta_source'] = np.array([csv_stat.st_size, csv_stat.st_mtime_ns], dtype=np.int64)
+
+    # 書き込み途中のファイルを読まれないように一時ファイルから置き換える
+    temp_path = snapshot_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temp_path, snapshot_path)
+    logging.info(f"Bookings snapshot saved: {len(df)} rows, {len(df.columns)} columns")
+
+def read_bookings_snapshot(snapshot_path=None, csv_path=None):
+    """スナップショットを読み込む（元CSVと対応していない場合はNone）"""
+    snapshot_path = snapshot_path or BOOKINGS_SNAPSHOT
+    csv_path = csv_path or BOOKINGS_CSV
+    if not os.path.exists(snapshot_path):
+        return None
+
+    with np.load(snapshot_path, allow_pickle=False) as data:
+        csv_stat = os.stat(csv_path)
+        source_size, source_mtime = data['meta_source'].tolist()
+        if source_size != csv_stat.st_size or source_mtime != csv_stat.st_mtime_ns:
+            # CSVが外部で更新されている
+            logging.info("Bookings snapshot is stale, falling back to CSV")
+            return None
+
+        columns = {}
+        for i, (column, kind) in enumerate(zip(data['meta_columns'].tolist(), data['meta_kinds'].tolist())):
+            if kind == 'str':
+                categories = data[f"col{i}_categories"].astype(object)
+                columns[column] = categories[data[f"col{i}_codes"]]
+            else:
+                columns[column] = data[f"col{i}_values"]
+        return pd.DataFrame(columns)
+
+# --- SQLite保存（config.json の "storage": {"backend": "sqlite"} で有効） ---
+
+DEFAULT_STORAGE_SETTINGS = {
+    'backend': 'csv',
+    'sqlite_path': os.path.join('data', 'processed_bookings.db')
+}
+
+BOOKINGS_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY,
+    booking_date TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    room_id TEXT NOT NULL,
+    booking_no TEXT NOT NULL,
+    company_name TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bookings_date_room_slot ON bookings (booking_date, room_id, slot);
+CREATE INDEX IF NOT EXISTS idx_bookings_booking_no ON bookings (booking_no);
+CREATE INDEX IF NOT EXISTS idx_bookings_company_name ON bookings (company_name);
+"""
+
+def get_storage_settings(config):
+    """保存方式の設定を取得（未設定の項目はデフォルト値）"""
+    settings = dict(DEFAULT_STORAGE_SETTINGS)
+    if config:
+        settings.update(config.get('storage') or {})
+    return settings
+
+def get_bookings_db_path(storage_settings):
+    """SQLiteファイルのパス（相対パスはアプリのフォルダ基準）"""
+    db_path = storage_settings['sqlite_path']
+    if not os.path.isabs(db_path):
+        db_path = os.path.join(BASE_DIR, db_path)
+    return db_path
+
+def connect_bookings_db(db_path):
+    """予約データベースに接続（テーブル・インデックスがなければ作成）"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    # 書き込み中も読み込みを止めない
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(BOOKINGS_DB_SCHEMA)
+    return conn
+
+def write_bookings_sqlite(df, config, db_path):
+    """予約データをSQLiteに保存（1トランザクションで全件を置き換え）"""
+    csv_column_mapping = (config or {}).get('csv_column_mapping', {})
+    datetime_col = csv_column_mapping.get('booking_datetime', '利用日時(予約内容)')
+    room_col = csv_column_mapping.get('room_name', '会議室(予約内容)')
+    key_col = csv_column_mapping.get('booking_id', '申込NO')
+    company_col = csv_column_mapping.get('company_name', '事業所名')
+
+    # 各行はCSVを読み直した場合と同じ型でJSONにして保存
+    typed_df = pd.DataFrame({column: infer_csv_column(df[column])[1] for column in df.columns})
+    records = typed_df.fillna('').to_dict('records')
+    # 絞り込んで返す場合も全件で振った識別キーを使えるよう保存しておく
+    add_booking_keys(records, config)
+
+    empty = pd.Series([''] * len(df), index=df.index)
+    if 'date' in df.columns and 'slot' in df.columns:
+        date_slot = df[['date', 'slot']].astype(str)
+    else:
+        date_slot = extract_booking_date_slot(df[datetime_col] if datetime_col in df.columns else empty)
+    if 'room_id' in df.columns:
+        room_ids = df['room_id'].astype(str)
+    else:
+        room_ids = resolve_room_ids(df[room_col] if room_col in df.columns else empty, build_room_lookup(config))
+    booking_nos = normalize_booking_keys(df[key_col] if key_col in df.columns else empty)
+    companies = df[company_col].astype(str) if company_col in df.columns else empty
+
+    rows = zip(
+        range(len(records)),
+        date_slot['date'].tolist(),
+        date_slot['slot'].tolist(),
+        room_ids.tolist(),
+        booking_nos.tolist(),
+        companies.tolist(),
+        (json.dumps(record, ensure_ascii=False) for record in records)
+    )
+
+    conn = connect_bookings_db(db_path)
+    try:
+        with conn:
+            conn.execute('DELETE FROM bookings')
+            conn.executemany(
+                'INSERT INTO bookings (id, booking_date, slot, room_id, booking_no, company_name, record) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+    finally:
+        conn.close()
+    logging.info(f"Bookings saved to SQLite: {len(records)} rows ({db_path})")
+
+def query_bookings_sqlite(db_path, date_from=None, date_to=None, room_ids=None, slot=None):
+    """SQLiteから予約データを取得（日付範囲・会議室・時間帯で絞り込み可能）"""
+    conditions = []
+    params = []
+    if date_from:
+        conditions.append('booking_date >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append('booking_date <= ?')
+        params.append(date_to)
+    if room_ids:
+        conditions.append(f"room_id IN ({', '.join('?' * len(room_ids))})")
+        params.extend(room_ids)
+    if slot:
+        conditions.append('slot = ?')
+        params.append(slot)
+
+    sql = 'SELECT record FROM bookings'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY id'
+
+    conn = connect_bookings_db(db_path)
+    try:
+        return [json.loads(record) for (record,) in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+def read_processed_bookings():
+    """処理済み予約データを読み込む（スナップショットがあれば優先）"""
+    try:
+        df = read_bookings_snapshot()
+        if df is not None:
+            logging.info("Loaded bookings from snapshot")
+            return df
+    except FileNotFoundError:
+        raise
+    except Exception as e:
+        logging.warning(f"Could not read bookings snapshot: {e}")
+
+    df, encoding = read_csv_auto(BOOKINGS_CSV)
+    logging.info(f"Successfully loaded CSV with encoding: {encoding}")
+    return df
+
 def fetch_from_csv():
     """CSVファイルからデータを取得"""
     try:
-        # Try multiple encodings for Japanese CSV files
-        for encoding in ['utf-8-sig', 'cp932', 'shift_jis', 'utf-8']:
-            try:
-                df = pd.read_csv(BOOKINGS_CSV, encoding=encoding)
-                logging.info(f"Successfully loaded CSV with encoding: {encoding}")
-                break
-            except UnicodeDecodeError:
-                continue
-        else:
-            raise Exception("Could not decode CSV file with any supported encoding")
+        config = load_config()
+        storage_settings = get_storage_settings(config)
+        if storage_settings['backend'] == 'sqlite':
+            db_path = get_bookings_db_path(storage_settings)
+            if os.path.exists(db_path):
+                bookings = query_bookings_sqlite(db_path)
+                logging.info(f"Loaded {len(bookings)} bookings from SQLite")
+                return fill_missing_derived_columns(bookings, config)
+            logging.info("SQLite database not created yet, reading CSV instead")
+
+        df = read_processed_bookings()
 
         # Fill NaN values with empty strings
         df = df.fillna('')
         bookings = df.to_dict('records')
         logging.info(f"Loaded {len(bookings)} bookings from CSV")
-        return bookings
+        return fill_missing_derived_columns(bookings, config)
 
     except FileNotFoundError:
         logging.warning(f"Warning: {BOOKINGS_CSV} not found. No data to display.")
@@ -338,6 +1473,907 @@ def fetch_from_csv():
         logging.error(f"Error loading CSV: {e}")
         return []
 
+# --- 予約データのメモリキャッシュ ---
+
+BookingCacheEntry = namedtuple('BookingCacheEntry', ['generation', 'signature', 'bookings'])
+
+def get_bookings_source_paths():
+    """予約データの読み込み元ファイル（変更検知用）"""
+    paths = [os.path.abspath(CONFIG_FILE), BOOKINGS_CSV]
+    storage_settings = get_storage_settings(load_config())
+    if storage_settings['backend'] == 'sqlite':
+        db_path = get_bookings_db_path(storage_settings)
+        paths.extend([db_path, db_path + '-wal'])
+    return paths
+
+def get_files_signature(paths):
+    """ファイルのサイズと更新時刻の組（存在しないファイルは None）"""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+# --- 変更通知（Server-Sent Events） ---
+
+# 同時に接続できるイベントストリーム数、保持するイベント数、無通信時のkeepalive間隔（秒）
+MAX_EVENT_CLIENTS = 100
+EVENT_HISTORY_SIZE = 50
+EVENT_KEEPALIVE_SECONDS = 25
+
+def format_event(event, data, event_id=None):
+    """SSE形式のテキストを作成（data はJSON文字列）"""
+    id_line = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{id_line}event: {event}\ndata: {data}\n\n"
+
+class EventBroadcaster:
+    """全クライアントに同じイベントを配信する（クライアントごとのキューは持たない）
+
+    イベントIDは「インスタンスID:連番」。サーバー再起動前のIDで再接続された場合は最新の状態を取り直してもらう
+    """
+
+    def __init__(self, max_clients=MAX_EVENT_CLIENTS, history_size=EVENT_HISTORY_SIZE):
+        self.max_clients = max_clients
+        self.instance_id = uuid.uuid4().hex[:12]
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history_size)  # [(連番, イベント名, データ)]
+        self._sequence = 0
+        self._clients = 0
+        self._listeners = []
+
+    @property
+    def client_count(self):
+        return self._clients
+
+    def add_listener(self, callback):
+        """イベント追加時に呼び出す関数を登録（EventStreamServer の起動に使う）"""
+        with self._condition:
+            self._listeners.append(callback)
+
+    def publish(self, event, data):
+        """イベントを追加して待機中のストリームを起こす"""
+        with self._condition:
+            self._sequence += 1
+            self._events.append((self._sequence, event, json.dumps(data, ensure_ascii=False)))
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback()
+        logging.info(f"Event published: {event} {data}")
+
+    def connect(self, last_event_id=None, initial_events=()):
+        """接続を登録して (開始位置, 最初に送るテキスト) を返す（上限を超えた場合はNone）"""
+        initial_events = list(initial_events)
+        with self._condition:
+            if self._clients >= self.max_clients:
+                return None
+            self._clients += 1
+            position = self._sequence
+            if last_event_id:
+                instance_id, _, sequence = str(last_event_id).rpartition(':')
+                if instance_id == self.instance_id and sequence.isdigit() and int(sequence) <= self._sequence:
+                    position = int(sequence)
+                else:
+                    # 再起動前のサーバーのイベントID：新しい連番から配信し、最新の状態を取り直してもらう
+                    initial_events.append(('resync', {}))
+        # 切断時の再接続間隔（ミリ秒）
+        text = 'retry: 5000\n\n' + ''.join(
+            format_event(event, json.dumps(data, ensure_ascii=False)) for event, data in initial_events
+        )
+        return position, text
+
+    def disconnect(self):
+        with self._condition:
+            self._clients -= 1
+
+    def _read(self, position):
+        """position より後のイベントを (新しい位置, テキスト) で返す（_condition を取得して呼ぶ）"""
+        if self._sequence <= position:
+            return position, ''
+        pending = [item for item in self._events if item[0] > position]
+        if not pending or pending[0][0] > position + 1:
+            # 保持している履歴より古い位置からの再接続：最新の状態を取り直してもらう
+            pending = [(self._sequence, 'resync', '{}')]
+        text = ''.join(format_event(event, data, f"{self.instance_id}:{sequence}") for sequence, event, data in pending)
+        return pending[-1][0], text
+
+    def read(self, position):
+        with self._condition:
+            return self._read(position)
+
+    def open_stream(self, last_event_id=None, initial_events=()):
+        """SSE形式のテキストを返すジェネレーターを作成（上限を超えた場合はNone）"""
+        connection = self.connect(last_event_id, initial_events)
+        if connection is None:
+            return None
+        return self._stream(*connection)
+
+    def _stream(self, position, initial_text):
+        try:
+            yield initial_text
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._sequence > position, timeout=EVENT_KEEPALIVE_SECONDS)
+                    position, text = self._read(position)
+                yield text or ': keepalive\n\n'
+        finally:
+            self.disconnect()
+
+event_broadcaster = EventBroadcaster()
+
+# 送信待ちにできるバイト数（超えた場合は切断）
+MAX_EVENT_BUFFER_BYTES = 1024 * 1024
+
+EVENT_STREAM_HEADERS = (
+    'HTTP/1.1 200 OK\r\n'
+    'Content-Type: text/event-stream; charset=utf-8\r\n'
+    'Cache-Control: no-cache\r\n'
+    'X-Accel-Buffering: no\r\n'
+    'Connection: close\r\n\r\n'
+)
+
+class EventStreamServer:
+    """/api/events のストリームを1つのスレッドで配信する（接続ごとにスレッドを使わない）
+
+    Webサーバーと同じポートで受け付けた接続を EventStreamRequestHandler から引き渡してもらう
+    """
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self._selector = None
+        self._wake_reader = None
+        self._wake_writer = None
+        self._lock = threading.Lock()
+        self._adopted = []  # 引き渡された接続 [(ソケット, 開始位置, 最初に送るテキスト)]
+        self._clients = {}  # {ソケット: {'buffer', 'position'}}（配信スレッドだけが使う）
+
+    @property
+    def running(self):
+        return self._selector is not None
+
+    def start(self):
+        """配信スレッドを起動"""
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._wake_reader, selectors.EVENT_READ)
+        self.broadcaster.add_listener(self.wake)
+        threading.Thread(target=self._run, name='event-stream', daemon=True).start()
+        logging.info("Event stream server started")
+
+    def adopt(self, sock, position, initial_text):
+        """リクエストを受け付けた接続を引き渡す（broadcaster.connect 済みのもの）"""
+        with self._lock:
+            self._adopted.append((sock, position, initial_text))
+        self.wake()
+
+    def wake(self):
+        """配信スレッドを起こす（イベント追加時・接続の引き渡し時に別スレッドから呼ばれる）"""
+        try:
+            self._wake_writer.send(b'\0')
+        except OSError:
+            pass  # 起こす通知がすでに溜まっている
+
+    def _run(self):
+        next_keepalive = time.monotonic() + EVENT_KEEPALIVE_SECONDS
+        while True:
+            try:
+                ready = self._selector.select(timeout=max(0, next_keepalive - time.monotonic()))
+                for key, mask in ready:
+                    if key.fileobj is self._wake_reader:
+                        self._drain_wake()
+                        self._accept_adopted()
+                        self._dispatch()
+                    elif key.fileobj in self._clients:
+                        if mask & selectors.EVENT_READ:
+                            self._receive(key.fileobj)
+                        if mask & selectors.EVENT_WRITE and key.fileobj in self._clients:
+                            self._flush(key.fileobj)
+
+                now = time.monotonic()
+                if now >= next_keepalive:
+                    next_keepalive = now + EVENT_KEEPALIVE_SECONDS
+                    for sock in list(self._clients):
+                        self._send(sock, ': keepalive\n\n')
+            except Exception as e:
+                logging.error(f"Event stream server error: {e}")
+
+    def _drain_wake(self):
+        try:
+            while self._wake_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _accept_adopted(self):
+        with self._lock:
+            adopted, self._adopted = self._adopted, []
+        for sock, position, initial_text in adopted:
+            sock.setblocking(False)
+            self._clients[sock] = {'buffer': b'', 'position': position}
+            self._selector.register(sock, selectors.EVENT_READ)
+            self._send(sock, EVENT_STREAM_HEADERS + initial_text)
+
+    def _receive(self, sock):
+        try:
+            data = sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        # ストリーム中に届いたデータは使わない（空なら切断された）
+        if not data:
+            self._close(sock)
+
+    def _dispatch(self):
+        """新しいイベントを各ストリームに送る"""
+        for sock in list(self._clients):
+            client = self._clients.get(sock)
+            if client is None:
+                continue
+            client['position'], text = self.broadcaster.read(client['position'])
+            if text:
+                self._send(sock, text)
+
+    def _send(self, sock, text):
+        client = self._clients[sock]
+        client['buffer'] += text.encode('utf-8')
+        if len(client['buffer']) > MAX_EVENT_BUFFER_BYTES:
+            # 受信が追いつかないクライアントは切断する（再接続時にイベントIDから送り直す）
+            self._close(sock)
+            return
+        self._flush(sock)
+
+    def _flush(self, sock):
+        client = self._clients[sock]
+        try:
+            sent = sock.send(client['buffer']) if client['buffer'] else 0
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._close(sock)
+            return
+        client['buffer'] = client['buffer'][sent:]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client['buffer'] else 0)
+        if self._selector.get_key(sock).events != events:
+            self._selector.modify(sock, events)
+
+    def _close(self, sock):
+        if self._clients.pop(sock, None) is not None:
+            self.broadcaster.disconnect()
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        sock.close()
+
+event_server = EventStreamServer(event_broadcaster)
+
+class EventStreamRequestHandler(WSGIRequestHandler):
+    """/api/events の接続を event_server に引き渡す（そのほかのリクエストは通常どおり Flask で処理）"""
+
+    def run_wsgi(self):
+        if not (event_server.running and self.command == 'GET' and urlsplit(self.path).path == '/api/events'):
+            return super().run_wsgi()
+
+        # 最新データの確認（読み直しを伴う場合がある）は配信スレッドではなく、このリクエストのスレッドで行う
+        connection = event_broadcaster.connect(self.headers.get('Last-Event-ID'), get_initial_events())
+        if connection is None:
+            # 接続数の上限を超えた場合は Flask が 503 を返す
+            return super().run_wsgi()
+        self.log_request(200)
+        self.close_connection = True
+        # ソケットを切り離して渡す（このスレッドの終了時に閉じられないようにする）
+        event_server.adopt(socket.socket(fileno=self.connection.detach()), *connection)
+
+# 差分を保持する世代数と、差分として扱う変更行数の上限（全体に対する割合）
+MAX_CHANGE_HISTORY = 20
+MAX_CHANGE_RATIO = 0.5
+
+def _booking_key_part(value):
+    """キーの一部を文字列化（12.0 は 12 として扱う：ブラウザ側の表記と揃える）"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+def get_booking_keys(bookings, config):
+    """予約ごとの識別キー「申込NO|利用日時|会議室」（同じ組み合わせの2件目以降は #2, #3 ...）"""
+    csv_column_mapping = (config or {}).get('csv_column_mapping', {})
+    key_columns = [
+        csv_column_mapping.get('booking_id', '申込NO'),
+        csv_column_mapping.get('booking_datetime', '利用日時(予約内容)'),
+        csv_column_mapping.get('room_name', '会議室(予約内容)')
+    ]
+    seen = {}
+    keys = []
+    for booking in bookings:
+        base_key = '|'.join(_booking_key_part(booking.get(column, '')) for column in key_columns)
+        count = seen.get(base_key, 0) + 1
+        seen[base_key] = count
+        keys.append(base_key if count == 1 else f"{base_key}#{count}")
+    return keys
+
+def add_booking_keys(bookings, config):
+    """各予約に識別キー booking_key を設定（全件で番号を振るため、クライアントは計算せずにこの値を使う）"""
+    for booking, key in zip(bookings, get_booking_keys(bookings, config)):
+        booking['booking_key'] = key
+    return bookings
+
+def diff_bookings(old_bookings, new_bookings):
+    """2つの世代の差分（追加・更新・削除）を booking_key で求める（変更が多すぎる場合はNone）"""
+    old_by_key = {booking['booking_key']: booking for booking in old_bookings}
+    new_by_key = {booking['booking_key']: booking for booking in new_bookings}
+
+    inserted = {key: booking for key, booking in new_by_key.items() if key not in old_by_key}
+    updated = {key: booking for key, booking in new_by_key.items() if key in old_by_key and old_by_key[key] != booking}
+    removed = [key for key in old_by_key if key not in new_by_key]
+
+    changed_rows = len(inserted) + len(updated) + len(removed)
+    if changed_rows > max(len(new_bookings), len(old_bookings)) * MAX_CHANGE_RATIO:
+        # 全件取得し直した方が早い
+        return None
+    return {'inserted': inserted, 'updated': updated, 'removed': removed}
+
+class BookingCache:
+    """予約データのキャッシュ（取り込みのたびに世代番号を進めて丸ごと置き換える）"""
+
+    def __init__(self, loader, check_interval=1.0):
+        self.loader = loader
+        self.check_interval = check_interval  # 外部でのファイル変更を確認する間隔（秒）
+        # サーバー再起動で世代番号が振り直されたことをクライアントが判別するためのID
+        self.instance_id = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._entry = None
+        self._generation = 0
+        self._last_check = 0.0
+        self._changes = deque(maxlen=MAX_CHANGE_HISTORY)  # [(世代, 前の世代からの差分)]
+
+    @property
+    def generation(self):
+        """現在の世代番号（未読み込みなら0）"""
+        entry = self._entry
+        return entry.generation if entry else 0
+
+    def get(self):
+        """キャッシュ済みのデータを返す（読み込み元が変わっていれば読み直す）"""
+        entry = self._entry
+        if entry is None:
+            return self.reload()
+
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return entry
+        self._last_check = now
+
+        paths = [path for path, _, _ in entry.signature]
+        if get_files_signature(paths) == entry.signature:
+            return entry
+
+        logging.info("Bookings source changed outside ingest, reloading cache")
+        return self.reload(stale_entry=entry)
+
+    def reload(self, stale_entry=None):
+        """データを読み込んで新しい世代に置き換える"""
+        with self._lock:
+            if stale_entry is not None and self._entry is not stale_entry:
+                # 待っている間に別のスレッドが読み直した
+                return self._entry
+
+            # 読み込み中に更新された場合に再度検知できるよう、先に署名を取る
+            signature = get_files_signature(get_bookings_source_paths())
+            bookings = add_booking_keys(self.loader(), load_config())
+            previous = self._entry
+            self._generation += 1
+            entry = BookingCacheEntry(self._generation, signature, bookings)
+
+            if previous is not None:
+                try:
+                    self._changes.append((entry.generation, diff_bookings(previous.bookings, bookings)))
+                except Exception as e:
+                    logging.warning(f"Could not compute bookings diff: {e}")
+                    self._changes.append((entry.generation, None))
+
+            self._entry = entry
+            self._last_check = time.monotonic()
+
+        logging.info(f"Bookings cache updated: generation {entry.generation} ({len(bookings)} bookings)")
+        event_broadcaster.publish('bookings', {'generation': entry.generation, 'instance': self.instance_id})
+        return entry
+
+    def diff_for(self, generation):
+        """指定した世代とその前の世代の差分を返す（保持していない場合はNone）"""
+        with self._lock:
+            for changed_generation, diff in self._changes:
+                if changed_generation == generation:
+                    return diff
+        return None
+
+    def changes_since(self, since):
+        """指定した世代以降の変更をまとめて返す（追えない場合は resync: True）"""
+        entry = self.get()
+        with self._lock:
+            changes = [(generation, diff) for generation, diff in self._changes if generation > since]
+        current = entry.generation
+
+        result = {'generation': current, 'resync': False, 'inserted': [], 'updated': [], 'removed': []}
+        if since == current:
+            return result
+
+        changes = [(generation, diff) for generation, diff in changes if generation <= current]
+        if since > current or len(changes) != current - since or any(diff is None for _, diff in changes):
+            result['resync'] = True
+            return result
+
+        # 各キーについて、最初の変更前に存在したかと最終的な状態を求める
+        existed_before = {}
+        final_state = {}
+        for _, diff in changes:
+            for key, booking in diff['inserted'].items():
+                existed_before.setdefault(key, False)
+                final_state[key] = booking
+            for key, booking in diff['updated'].items():
+                existed_before.setdefault(key, True)
+                final_state[key] = booking
+            for key in diff['removed']:
+                existed_before.setdefault(key, True)
+                final_state[key] = None
+
+        for key, booking in final_state.items():
+            if booking is None:
+                if existed_before[key]:
+                    result['removed'].append(key)
+            elif existed_before[key]:
+                result['updated'].append({'key': key, 'booking': booking})
+            else:
+                result['inserted'].append({'key': key, 'booking': booking})
+        return result
+
+booking_cache = BookingCache(fetch_from_csv)
+
+# --- /api/bookings の応答本文キャッシュ（世代ごとにJSONとgzipを1回だけ作成） ---
+
+EncodedBookings = namedtuple('EncodedBookings', ['generation', 'etag', 'body', 'gzip_body'])
+MAX_ENCODED_RESPONSES = 64
+_encoded_responses = {}  # {(世代, 検索条件): EncodedBookings}
+_encoded_responses_lock = threading.Lock()
+
+def encode_bookings(generation, bookings):
+    """予約データのJSON本文・gzip本文・ETagを作成"""
+    body = json.dumps(bookings, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    # 内容から求めるのでサーバーを再起動しても同じデータなら同じETagになる
+    etag = hashlib.sha1(body).hexdigest()[:20]
+    return EncodedBookings(generation, etag, body, gzip.compress(body, compresslevel=6))
+
+def get_encoded_bookings(entry, query=None):
+    """キャッシュの世代と検索条件に対応する応答本文を返す（世代ごとに1回だけ作成）"""
+    cache_key = (entry.generation, query)
+    encoded = _encoded_responses.get(cache_key)
+    if encoded is not None:
+        return encoded
+
+    with _encoded_responses_lock:
+        encoded = _encoded_responses.get(cache_key)
+        if encoded is not None:
+            return encoded
+
+        bookings = entry.bookings if query is None else query_bookings(entry, query)
+        encoded = encode_bookings(entry.generation, bookings)
+
+        # 古い世代の応答は不要なので破棄
+        for key in [key for key in _encoded_responses if key[0] != entry.generation]:
+            del _encoded_responses[key]
+        if len(_encoded_responses) >= MAX_ENCODED_RESPONSES:
+            _encoded_responses.pop(next(iter(_encoded_responses)))
+        _encoded_responses[cache_key] = encoded
+
+    logging.info(f"Encoded bookings for generation {entry.generation} {query or ''}: {len(encoded.body)} bytes (gzip {len(encoded.gzip_body)} bytes)")
+    return encoded
+
+# --- 日付順インデックス（期間・会議室・時間帯での絞り込み用） ---
+
+BookingIndex = namedtuple('BookingIndex', ['generation', 'order', 'sorted_dates', 'slots', 'room_ids'])
+_booking_index = None
+_booking_index_lock = threading.Lock()
+
+def build_booking_index(entry, config):
+    """予約データの日付順インデックスを作成（date・slot列は取り込み時に作成済み）"""
+    dates = np.array([booking.get('date', '') for booking in entry.bookings], dtype='U10')
+    order = np.argsort(dates, kind='stable')
+
+    return BookingIndex(
+        entry.generation,
+        order,
+        dates[order],
+        np.array([booking.get('slot', '') for booking in entry.bookings], dtype=object),
+        np.array([booking.get('room_id', '') for booking in entry.bookings], dtype=object)
+    )
+
+def get_booking_index(entry):
+    """キャッシュの世代に対応するインデックスを返す（世代ごとに1回だけ作成）"""
+    global _booking_index
+    index = _booking_index
+    if index is not None and index.generation == entry.generation:
+        return index
+
+    with _booking_index_lock:
+        index = _booking_index
+        if index is None or index.generation != entry.generation:
+            index = build_booking_index(entry, load_config())
+            _booking_index = index
+    return index
+
+def query_booking_positions(index, date_from=None, date_to=None, room_ids=None, slot=None):
+    """条件に合う予約の位置を元の順番で返す"""
+    lo = np.searchsorted(index.sorted_dates, date_from, side='left') if date_from else 0
+    hi = np.searchsorted(index.sorted_dates, date_to, side='right') if date_to else len(index.sorted_dates)
+    positions = np.sort(index.order[lo:hi])
+
+    if room_ids:
+        # 分割ルールのコピー先の行は取り込み時に作成済み
+        positions = positions[np.isin(index.room_ids[positions], list(room_ids))]
+    if slot:
+        positions = positions[index.slots[positions] == slot]
+    return positions.tolist()
+
+def query_bookings(entry, query):
+    """検索条件に合う予約を返す（SQLite保存時はデータベースのインデックスで絞り込む）"""
+    config = load_config()
+    storage_settings = get_storage_settings(config)
+    if storage_settings['backend'] == 'sqlite':
+        db_path = get_bookings_db_path(storage_settings)
+        # 応答はキャッシュの世代ごとに保存するため、世代を作成した時からデータベースが変わっていない場合だけ使う
+        # （取り込み直後でキャッシュが読み直される前は、メモリ上のデータで絞り込む）
+        paths = [path for path, _, _ in entry.signature]
+        if os.path.exists(db_path) and get_files_signature(paths) == entry.signature:
+            bookings = query_bookings_sqlite(db_path, *query)
+            # 識別キーを保存していない旧形式のデータベースはメモリ上のデータで絞り込む
+            if (not bookings or 'booking_key' in bookings[0]) and get_files_signature(paths) == entry.signature:
+                return fill_missing_derived_columns(bookings, config)
+            logging.info(f"Bookings database differs from cache generation {entry.generation}, filtering in memory")
+    positions = query_booking_positions(get_booking_index(entry), *query)
+    return [entry.bookings[i] for i in positions]
+
+def parse_bookings_query(args):
+    """/api/bookings の検索条件を解析（条件がなければNone、不正な値はValueError）"""
+    date_from = args.get('from') or None
+    date_to = args.get('to') or None
+    for value in (date_from, date_to):
+        if value:
+            datetime.strptime(value, '%Y-%m-%d')
+
+    room_ids = []
+    for value in args.getlist('room'):
+        room_ids.extend(room_id.strip() for room_id in value.split(',') if room_id.strip())
+
+    slot = args.get('slot') or None
+    if slot and slot not in SLOT_IDS.values():
+        raise ValueError(f"Unknown slot: {slot}")
+
+    if not (date_from or date_to or room_ids or slot):
+        return None
+    return (date_from, date_to, tuple(sorted(set(room_ids))), slot)
+
+# --- 利用時間（分単位）の会議室別インデックス ---
+# 会議室ごとに開始時刻順の配列を持ち、二分探索で重なる予約を求める。
+# 時刻は 1970-01-01 からの通算分数（日付 × 1440 + 0時からの分数）。
+
+MINUTES_PER_DAY = 24 * 60
+
+RoomIntervals = namedtuple('RoomIntervals', ['starts', 'ends', 'positions', 'max_length'])
+IntervalIndex = namedtuple('IntervalIndex', ['generation', 'rooms'])
+_interval_index = None
+_interval_index_lock = threading.Lock()
+
+def to_absolute_minutes(dates, minutes):
+    """日付（YYYY-MM-DD）と0時からの分数を通算分数に変換"""
+    days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+    return days * MINUTES_PER_DAY + np.asarray(minutes, dtype=np.int64)
+
+def build_interval_index(entry, config):
+    """会議室ごとの利用時間インデックスを作成（取消済みの予約は含めない）"""
+    cancel_col = (config or {}).get('csv_column_mapping', {}).get('cancellation_date', '取消日(予約内容)')
+    positions = np.array([
+        position for position, booking in enumerate(entry.bookings)
+        if booking.get('date') and booking.get('room_id') and not str(booking.get(cancel_col, '')).strip()
+    ], dtype=np.int64)
+
+    bookings = [entry.bookings[position] for position in positions]
+    dates = [booking['date'] for booking in bookings]
+    starts = to_absolute_minutes(dates, [booking.get('start_minute', 0) for booking in bookings])
+    ends = to_absolute_minutes(dates, [booking.get('end_minute', 0) for booking in bookings])
+    room_ids = np.array([booking['room_id'] for booking in bookings], dtype=object)
+
+    rooms = {}
+    for room_id in pd.unique(room_ids):
+        in_room = room_ids == room_id
+        order = np.argsort(starts[in_room], kind='stable')
+        room_starts = starts[in_room][order]
+        room_ends = ends[in_room][order]
+        rooms[room_id] = RoomIntervals(
+            room_starts, room_ends, positions[in_room][order],
+            int((room_ends - room_starts).max()) if len(room_starts) else 0
+        )
+    return IntervalIndex(entry.generation, rooms)
+
+def get_interval_index(entry):
+    """キャッシュの世代に対応する利用時間インデックスを返す（世代ごとに1回だけ作成）"""
+    global _interval_index
+    index = _interval_index
+    if index is not None and index.generation == entry.generation:
+        return index
+
+    with _interval_index_lock:
+        index = _interval_index
+        if index is None or index.generation != entry.generation:
+            index = build_interval_index(entry, load_config())
+            _interval_index = index
+    return index
+
+def find_overlapping_positions(room_intervals, start, end):
+    """[start, end) と重なる予約の位置を返す
+
+    開始時刻が end より前で、かつ start - 最長の利用時間 より後の範囲だけを調べる
+    """
+    lo = np.searchsorted(room_intervals.starts, start - room_intervals.max_length, side='right')
+    hi = np.searchsorted(room_intervals.starts, end, side='left')
+    overlapping = room_intervals.ends[lo:hi] > start
+    return room_intervals.positions[lo:hi][overlapping].tolist()
+
+# --- 空き状況（日付 × 会議室 × 時間帯 の予約数） ---
+# 予約数を数えておき、取り込みで差分が分かる場合は変わった予約の分だけ増減する。
+
+SLOT_ORDER = list(SLOT_IDS.values())
+MAX_AVAILABILITY_DAYS = 366
+
+OccupancyIndex = namedtuple('OccupancyIndex', ['generation', 'first_day', 'room_positions', 'counts', 'cells'])
+_occupancy_index = None
+_occupancy_index_lock = threading.Lock()
+
+def get_occupancy_cell(booking, cancel_col):
+    """予約が占める (通算日, 会議室ID, 時間帯の番号) を返す（取消済み・不明な予約はNone）"""
+    if str(booking.get(cancel_col, '')).strip():
+        return None
+    date, room_id, slot = booking.get('date'), booking.get('room_id'), booking.get('slot')
+    if not date or not room_id or slot not in SLOT_ORDER:
+        return None
+    return (int(np.datetime64(date, 'D').astype(np.int64)), room_id, SLOT_ORDER.index(slot))
+
+def build_occupancy_index(entry, config):
+    """全予約から空き状況の配列を作成"""
+    cancel_col = (config or {}).get('csv_column_mapping', {}).get('cancellation_date', '取消日(予約内容)')
+    cells = {booking['booking_key']: get_occupancy_cell(booking, cancel_col) for booking in entry.bookings}
+    occupied = [cell for cell in cells.values() if cell is not None]
+
+    room_ids = [room.get('id') for room in (config or {}).get('rooms', [])]
+    room_ids += sorted({room_id for _, room_id, _ in occupied} - set(room_ids))
+    room_positions = {room_id: position for position, room_id in enumerate(room_ids)}
+
+    days = np.array([day for day, _, _ in occupied], dtype=np.int64)
+    first_day = int(days.min()) if len(days) else 0
+    counts = np.zeros((int(days.max()) - first_day + 1 if len(days) else 0, len(room_ids), len(SLOT_ORDER)), dtype=np.int32)
+    if len(days):
+        np.add.at(counts, (
+            days - first_day,
+            np.array([room_positions[room_id] for _, room_id, _ in occupied], dtype=np.int64),
+            np.array([slot for _, _, slot in occupied], dtype=np.int64)
+        ), 1)
+    return OccupancyIndex(entry.generation, first_day, room_positions, counts, cells)
+
+def update_occupancy_index(index, entry, diff, config):
+    """前の世代の空き状況に差分を反映（配列の範囲外の予約があればNone）"""
+    cancel_col = (config or {}).get('csv_column_mapping', {}).get('cancellation_date', '取消日(予約内容)')
+    counts = index.counts.copy()
+    cells = dict(index.cells)
+
+    def change(cell, amount):
+        if cell is None:
+            return True
+        day, room_id, slot = cell
+        offset = day - index.first_day
+        if room_id not in index.room_positions or not 0 <= offset < counts.shape[0]:
+            return False
+        counts[offset, index.room_positions[room_id], slot] += amount
+        return True
+
+    for key in diff['removed']:
+        change(cells.pop(key, None), -1)
+    for key, booking in list(diff['updated'].items()) + list(diff['inserted'].items()):
+        change(cells.get(key), -1)
+        cells[key] = get_occupancy_cell(booking, cancel_col)
+        if not change(cells[key], 1):
+            return None
+    return OccupancyIndex(entry.generation, index.first_day, index.room_positions, counts, cells)
+
+def get_occupancy_index(entry):
+    """キャッシュの世代に対応する空き状況を返す（直前の世代からは差分で更新）"""
+    global _occupancy_index
+    index = _occupancy_index
+    if index is not None and index.generation == entry.generation:
+        return index
+
+    with _occupancy_index_lock:
+        index = _occupancy_index
+        if index is None or index.generation != entry.generation:
+            config = load_config()
+            updated = None
+            if index is not None and index.generation == entry.generation - 1:
+                diff = booking_cache.diff_for(entry.generation)
+                if diff is not None:
+                    updated = update_occupancy_index(index, entry, diff, config)
+            index = updated or build_occupancy_index(entry, config)
+            _occupancy_index = index
+    return index
+
+def query_availability(index, days, room_ids, slots, config):
+    """日付 × 会議室 × 時間帯 ごとに空いているかを返す
+
+    分割ルールのコピー元の会議室（ホール全体など）は、コピー先のどれかが予約済みなら空いていない扱い
+    """
+    days = np.asarray(days, dtype=np.int64) - index.first_day
+    in_range = (days >= 0) & (days < index.counts.shape[0])
+    occupied = np.zeros((len(days), len(index.room_positions), len(SLOT_ORDER)), dtype=bool)
+    occupied[in_range] = index.counts[days[in_range]] > 0
+
+    # コピー先 → コピー元 の行列で、コピー先の予約をコピー元に伝える
+    propagation = np.zeros((len(index.room_positions), len(index.room_positions)), dtype=np.int64)
+    for rule in (config or {}).get('data_split_rules', []):
+        source = index.room_positions.get(rule.get('source_room_id'))
+        if not rule.get('enabled') or source is None:
+            continue
+        for target_room_id in rule.get('target_room_ids', []):
+            target = index.room_positions.get(target_room_id)
+            if target is not None:
+                propagation[target, source] = 1
+    occupied |= np.einsum('drs,rq->dqs', occupied.astype(np.int64), propagation) > 0
+
+    room_positions = [index.room_positions.get(room_id) for room_id in room_ids]
+    free = np.ones((len(days), len(room_ids), len(slots)), dtype=bool)
+    known = np.array([position is not None for position in room_positions], dtype=bool)
+    if known.any():
+        slot_positions = [SLOT_ORDER.index(slot) for slot in slots]
+        known_positions = [position for position in room_positions if position is not None]
+        free[:, known] = ~occupied[:, known_positions][:, :, slot_positions]
+    return free
+
+# --- 全文検索（文字バイグラムの転置インデックス） ---
+
+# 検索対象の列 (csv_column_mappingのキー, 既定の列名, 一致した場合の重み)
+SEARCH_FIELDS = [
+    ('display_name', '案内表示名(予約内容)', 5),
+    ('company_name', '事業所名', 3),
+    ('company_name_kana', '事業所名カナ', 3),
+    ('contact_person', '担当者名', 3),
+    ('purpose', '利用目的(予約内容)', 1),
+    ('memo', 'メモ', 1),
+]
+SEARCH_MAX_PER_PAGE = 200
+
+SearchIndex = namedtuple('SearchIndex', ['generation', 'fields', 'postings', 'dates'])
+_search_index = None
+_search_index_lock = threading.Lock()
+
+# ひらがな → カタカナ（ぁ〜ゖ）
+HIRAGANA_TO_KATAKANA = {code: code + 0x60 for code in range(0x3041, 0x3097)}
+
+def normalize_search_text(value):
+    """検索用に文字列を正規化（全角・半角の統一、ひらがなをカタカナに、英字を小文字に）"""
+    return unicodedata.normalize('NFKC', str(value)).translate(HIRAGANA_TO_KATAKANA).lower()
+
+def normalize_search_texts(values):
+    """列の値をまとめて正規化（同じ値は1回だけ処理）"""
+    normalized = {}
+    result = []
+    for value in values:
+        if value not in normalized:
+            normalized[value] = normalize_search_text(value)
+        result.append(normalized[value])
+    return result
+
+def get_bigrams(text):
+    """文字列に含まれる2文字の組を返す"""
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+def build_search_index(entry, config):
+    """検索対象の列から バイグラム → 予約の位置 の転置インデックスを作成"""
+    csv_column_mapping = (config or {}).get('csv_column_mapping', {})
+
+    fields = []
+    for key, default_col, weight in SEARCH_FIELDS:
+        column = csv_column_mapping.get(key, default_col)
+        # 正規化した検索キーはデータの世代ごとに1回だけ作成し、検索時は検索語だけを正規化する
+        texts = normalize_search_texts(str(booking.get(column, '')) for booking in entry.bookings)
+        fields.append((np.array(texts, dtype=str) if texts else np.array([], dtype='U1'), weight))
+
+    postings = {}
+    for position, booking in enumerate(entry.bookings):
+        if booking.get('original_room_id'):
+            # 分割ルールで追加した行は元の予約と同じ内容なので検索対象にしない
+            continue
+        bigrams = set()
+        for texts, _ in fields:
+            bigrams |= get_bigrams(texts[position])
+        for bigram in bigrams:
+            postings.setdefault(bigram, []).append(position)
+    postings = {bigram: np.array(positions, dtype=np.int32) for bigram, positions in postings.items()}
+
+    dates = np.array([booking.get('date', '') for booking in entry.bookings], dtype='U10')
+    return SearchIndex(entry.generation, fields, postings, dates)
+
+def get_search_index(entry):
+    """キャッシュの世代に対応する検索インデックスを返す（世代ごとに1回だけ作成）"""
+    global _search_index
+    index = _search_index
+    if index is not None and index.generation == entry.generation:
+        return index
+
+    with _search_index_lock:
+        index = _search_index
+        if index is None or index.generation != entry.generation:
+            start = time.perf_counter()
+            index = build_search_index(entry, load_config())
+            _search_index = index
+            logging.info(f"Search index built: generation {entry.generation} ({len(index.postings)} bigrams, {time.perf_counter() - start:.3f}s)")
+    return index
+
+def search_booking_positions(index, query):
+    """検索語（空白区切りはAND）に一致する予約の位置を関連度順に返す"""
+    terms = [normalize_search_text(term) for term in query.split()]
+    terms = [term for term in terms if term]
+    if not any(len(term) >= 2 for term in terms):
+        raise ValueError("Search query must contain at least 2 characters")
+
+    # バイグラムの出現位置の共通部分で候補を絞る（出現数の少ない組から）
+    bigrams = set()
+    for term in terms:
+        bigrams |= get_bigrams(term)
+    if any(bigram not in index.postings for bigram in bigrams):
+        return []
+
+    postings = sorted((index.postings[bigram] for bigram in bigrams), key=len)
+    candidates = postings[0]
+    for positions in postings[1:]:
+        candidates = np.intersect1d(candidates, positions, assume_unique=True)
+        if len(candidates) == 0:
+            return []
+
+    # バイグラムの一致だけでは連続しているとは限らないため、実際の文字列で確認して採点
+    scores = np.zeros(len(candidates), dtype=np.int64)
+    for term in terms:
+        term_scores = np.zeros(len(candidates), dtype=np.int64)
+        for texts, weight in index.fields:
+            found = np.char.find(texts[candidates], term)
+            # 先頭で一致した場合は重みを2倍にする
+            term_scores += np.where(found == 0, weight * 2, np.where(found > 0, weight, 0))
+        matched = term_scores > 0
+        candidates, scores = candidates[matched], scores[matched] + term_scores[matched]
+
+    # 関連度の高い順、同じ関連度なら利用日の古い順
+    order = np.lexsort((candidates, index.dates[candidates], -scores))
+    return candidates[order].tolist()
+
+def make_cached_json_response(encoded):
+    """ETag付きのJSON応答を作成（If-None-Matchが一致すれば304）"""
+    use_gzip = 'gzip' in request.accept_encodings
+    # 圧縮の有無で本文が異なるため、ETagも別にする
+    etag = f"{encoded.etag}-gz" if use_gzip else encoded.etag
+
+    if request.if_none_match.contains(encoded.etag) or request.if_none_match.contains(f"{encoded.etag}-gz"):
+        response = Response(status=304)
+    else:
+        response = Response(encoded.gzip_body if use_gzip else encoded.body, mimetype='application/json')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+
+    response.set_etag(etag)
+    # 毎回ETagで確認させる（変更がなければ304で本文は送らない）
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
 @app.route('/')
 def serve_index():
     try:
@@ -358,14 +2394,207 @@ def get_config():
 
 @app.route('/api/bookings')
 def get_bookings():
+    """予約データを返す（from/to=YYYY-MM-DD, room=会議室ID, slot=morning|afternoon|night で絞り込み可能）"""
     try:
-        bookings = fetch_from_csv()
-        logging.info(f"Returning {len(bookings)} bookings")
-        return jsonify(bookings)
+        try:
+            query = parse_bookings_query(request.args)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid query: {e}"}), 400
+
+        entry = booking_cache.get()
+        logging.info(f"Returning bookings (generation {entry.generation}) {query or ''}")
+        response = make_cached_json_response(get_encoded_bookings(entry, query))
+        # 差分取得（/api/bookings/changes）の起点としてクライアントが使う
+        response.headers['X-Data-Generation'] = str(entry.generation)
+        response.headers['X-Data-Instance'] = booking_cache.instance_id
+        return response
     except Exception as e:
         logging.error(f"Error in /api/bookings: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/bookings/changes')
+def get_booking_changes():
+    """指定した世代以降に追加・更新・削除された予約を返す（since=世代番号, instance=サーバーID）"""
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({"error": "since parameter is required"}), 400
+
+        instance = request.args.get('instance')
+        if instance and instance != booking_cache.instance_id:
+            # サーバーが再起動しているので世代番号は比較できない
+            result = {'generation': booking_cache.get().generation, 'resync': True, 'inserted': [], 'updated': [], 'removed': []}
+        else:
+            result = booking_cache.changes_since(since)
+
+        result['instance'] = booking_cache.instance_id
+        return jsonify(result)
+    except Exception as e:
+        logging.error(f"Error in /api/bookings/changes: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def get_initial_events():
+    """イベントストリームの接続時に送るイベント（現在の世代番号）"""
+    entry = booking_cache.get()
+    return [('hello', {'generation': entry.generation, 'instance': booking_cache.instance_id})]
+
+@app.route('/api/events')
+def get_events():
+    """予約データ・設定の変更を Server-Sent Events で通知する"""
+    # 通常は EventStreamRequestHandler が event_server に引き渡すため、ここで配信するのは event_server を起動していない場合だけ
+    stream = event_broadcaster.open_stream(request.headers.get('Last-Event-ID'), get_initial_events())
+    if stream is None:
+        # 接続数の上限を超えた場合、クライアントは定期確認に切り替える
+        return jsonify({"error": "Too many event stream connections"}), 503
+
+    response = Response(stream, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/intervals')
+def get_room_intervals():
+    """指定した時刻・時間範囲に各会議室が空いているかを返す
+
+    date=YYYY-MM-DD, start=HH:MM, end=HH:MM（省略時はstartの時点のみ）, room=会議室ID（省略時は全会議室）
+    """
+    try:
+        try:
+            date = request.args.get('date', '')
+            datetime.strptime(date, '%Y-%m-%d')
+            start_minute = parse_time_minutes(request.args.get('start', ''))
+            end_arg = request.args.get('end')
+            end_minute = parse_time_minutes(end_arg) if end_arg else start_minute + 1
+            if end_minute <= start_minute:
+                raise ValueError("end must be later than start")
+        except ValueError as e:
+            return jsonify({"error": f"Invalid query: {e}"}), 400
+
+        room_ids = []
+        for value in request.args.getlist('room'):
+            room_ids.extend(room_id.strip() for room_id in value.split(',') if room_id.strip())
+
+        entry = booking_cache.get()
+        index = get_interval_index(entry)
+        if not room_ids:
+            config = load_config() or {}
+            room_ids = [room.get('id') for room in config.get('rooms', [])] or list(index.rooms)
+
+        start, end = to_absolute_minutes([date, date], [start_minute, end_minute])
+        rooms = {}
+        for room_id in room_ids:
+            room_intervals = index.rooms.get(room_id)
+            positions = find_overlapping_positions(room_intervals, start, end) if room_intervals else []
+            rooms[room_id] = {
+                'free': not positions,
+                'bookings': [entry.bookings[position] for position in positions]
+            }
+
+        return jsonify({'date': date, 'start_minute': start_minute, 'end_minute': end_minute, 'rooms': rooms})
+    except Exception as e:
+        logging.error(f"Error in /api/intervals: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/availability')
+def get_availability():
+    """複数の日付・会議室・時間帯の空き状況を返す
+
+    date=YYYY-MM-DD（複数指定可）または from/to, room=会議室ID（省略時は全会議室）, slot=morning|afternoon|night（省略時は全時間帯）
+    """
+    try:
+        try:
+            dates = []
+            for value in request.args.getlist('date'):
+                dates.extend(date.strip() for date in value.split(',') if date.strip())
+            if request.args.get('from') and request.args.get('to'):
+                first = np.datetime64(request.args['from'], 'D')
+                last = np.datetime64(request.args['to'], 'D')
+                if last - first >= MAX_AVAILABILITY_DAYS:
+                    raise ValueError(f"Date range must be within {MAX_AVAILABILITY_DAYS} days")
+                dates.extend(str(day) for day in np.arange(first, last + 1))
+            if not dates:
+                raise ValueError("date or from/to parameter is required")
+            if len(dates) > MAX_AVAILABILITY_DAYS:
+                raise ValueError(f"Too many dates (max {MAX_AVAILABILITY_DAYS})")
+            dates = list(dict.fromkeys(datetime.strptime(date, '%Y-%m-%d').strftime('%Y-%m-%d') for date in dates))
+
+            slots = []
+            for value in request.args.getlist('slot'):
+                slots.extend(slot.strip() for slot in value.split(',') if slot.strip())
+            for slot in slots:
+                if slot not in SLOT_ORDER:
+                    raise ValueError(f"Unknown slot: {slot}")
+            slots = slots or SLOT_ORDER
+        except ValueError as e:
+            return jsonify({"error": f"Invalid query: {e}"}), 400
+
+        config = load_config() or {}
+        room_ids = []
+        for value in request.args.getlist('room'):
+            room_ids.extend(room_id.strip() for room_id in value.split(',') if room_id.strip())
+        room_ids = room_ids or [room.get('id') for room in config.get('rooms', [])]
+
+        entry = booking_cache.get()
+        days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+        free = query_availability(get_occupancy_index(entry), days, room_ids, slots, config)
+
+        # 指定したすべての日付で空いている会議室（時間帯ごと）
+        free_on_all_dates = free.all(axis=0)
+        return jsonify({
+            'generation': entry.generation,
+            'dates': dates,
+            'rooms': room_ids,
+            'slots': slots,
+            'free': {
+                date: {slot: [room_id for r, room_id in enumerate(room_ids) if free[d, r, s]] for s, slot in enumerate(slots)}
+                for d, date in enumerate(dates)
+            },
+            'free_on_all_dates': {
+                slot: [room_id for r, room_id in enumerate(room_ids) if free_on_all_dates[r, s]] for s, slot in enumerate(slots)
+            }
+        })
+    except Exception as e:
+        logging.error(f"Error in /api/availability: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/conflicts')
+def get_conflicts():
+    """取り込み時に見つかった重複予約（同じ日・時間帯・部屋の別々の予約）を返す"""
+    try:
+        return jsonify(load_conflict_report())
+    except Exception as e:
+        logging.error(f"Error in /api/conflicts: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/search')
+def search_bookings():
+    """予約を全文検索して関連度順に返す（q=検索語, page=ページ番号, per_page=件数）"""
+    try:
+        query = request.args.get('q', '').strip()
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 50, type=int)
+        if page < 1 or not 1 <= per_page <= SEARCH_MAX_PER_PAGE:
+            return jsonify({"error": "Invalid page or per_page"}), 400
+
+        entry = booking_cache.get()
+        try:
+            positions = search_booking_positions(get_search_index(entry), query)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        start = (page - 1) * per_page
+        return jsonify({
+            'query': query,
+            'total': len(positions),
+            'page': page,
+            'per_page': per_page,
+            'generation': entry.generation,
+            'results': [entry.bookings[position] for position in positions[start:start + per_page]]
+        })
+    except Exception as e:
+        logging.error(f"Error in /api/search: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/upload', methods=['POST'])
 def upload_files():
     """WebページからのCSVファイルアップロードを処理"""
@@ -442,19 +2671,16 @@ def upload_files():
                     logger.warning(f"CSV validation failed for {filename}: {validation_message}")
                     continue
 
+                # 保存済みのファイルは書き込みの完了を待たずに取り込む
+                upload_tracker.mark_complete(file_path)
                 uploaded_files.append(filename)
                 logger.info(f"File uploaded and validated: {filename} ({file_size} bytes)")
 
-        # Process uploaded files immediately
+        # 取り込みはバックグラウンドで行い、進捗は /api/jobs/<job_id> で確認する
+        job = None
         if uploaded_files:
-            # Wait a moment for file to be saved properly
-            time.sleep(0.5)
-
-            # Trigger CSV processing
-            if process_csv_files():
-                processing_message = "CSVファイルが正常に処理されました"
-            else:
-                processing_message = "CSVファイルのアップロードは完了しましたが、処理中にエラーが発生しました"
+            job = ingest_coordinator.submit(uploaded_files)
+            processing_message = "取り込みを開始しました"
         else:
             processing_message = "処理できるファイルがありませんでした"
 
@@ -472,8 +2698,9 @@ def upload_files():
             "uploaded_files": uploaded_files,
             "failed_files": failed_files,
             "total_uploaded": len(uploaded_files),
-            "total_failed": len(failed_files)
-        })
+            "total_failed": len(failed_files),
+            "job_id": job.id if job else None
+        }), 202 if job else 200
 
     except Exception as e:
         logging.error(f"Error in file upload: {e}")
@@ -482,13 +2709,25 @@ def upload_files():
             "message": f"アップロード中にエラーが発生しました: {str(e)}"
         }), 500
 
+@app.route('/api/jobs/<job_id>')
+def get_ingest_job(job_id):
+    """取り込みジョブの状態（段階・読み込んだ行数・処理速度・エラー）"""
+    job = ingest_coordinator.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/api/status')
 def server_status():
     """サーバーステータスを返す"""
     return jsonify({
         'status': 'running',
         'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
-        'uptime': time.time() - app.start_time if hasattr(app, 'start_time') else 0
+        'uptime': time.time() - app.start_time if hasattr(app, 'start_time') else 0,
+        'data_generation': booking_cache.generation,
+        'event_clients': event_broadcaster.client_count,
+        'ingest_running': ingest_coordinator.running,
+        'ingest_runs': ingest_coordinator.run_count
     })
 
 
@@ -876,6 +3115,15 @@ def find_available_port(start_port=5000, max_attempts=10):
     logging.warning(f"No available port found between {start_port} and {start_port + max_attempts - 1}")
     return start_port
 
+def start_event_server():
+    """変更通知の配信スレッドを起動（失敗した場合は Flask がリクエストごとに配信する）"""
+    try:
+        event_server.start()
+        return True
+    except OSError as e:
+        logging.warning(f"Could not start event stream server: {e}")
+        return False
+
 def run_server_with_tray():
     """サーバーをシステムトレイと一緒に実行"""
     global observer, server_port
@@ -905,6 +3153,8 @@ def run_server_with_tray():
         print("[OK] Initial CSV processing completed")
     else:
         print("[INFO] No CSV files to process initially")
+        # 停止中に変更された会議室設定・分割ルールを保存済みデータに反映
+        rebuild_processed_bookings()
 
     # Start file watcher
     observer = start_file_watcher()
@@ -914,9 +3164,15 @@ def run_server_with_tray():
         print("[WARNING] File watcher failed to start")
 
     # Test CSV loading
-    bookings = fetch_from_csv()
+    bookings = booking_cache.get().bookings
     print(f"[OK] CSV loaded: {len(bookings)} bookings")
 
+    # Start event stream server
+    if start_event_server():
+        print("[OK] Event stream server started")
+    else:
+        print("[WARNING] Event stream server failed to start (events are served by Flask)")
+
     print("[OK] Starting Flask server...")
     print(f"[INFO] Upload CSV files to: {UPLOADS_DIR}")
     print(f"[INFO] Processed files moved to: {os.path.join(BASE_DIR, 'processed')}")
@@ -925,7 +3181,7 @@ def run_server_with_tray():
     def run_flask():
         # Record server start time for uptime calculation
         app.start_time = time.time()
-        app.run(host='0.0.0.0', port=server_port, debug=False, use_reloader=False)
+        app.run(host='0.0.0.0', port=server_port, debug=False, use_reloader=False, request_handler=EventStreamRequestHandler)
 
     flask_thread = threading.Thread(target=run_flask, daemon=True)
     flask_thread.start()
@@ -971,6 +3227,8 @@ def run_server():
         print("[OK] Initial CSV processing completed")
     else:
         print("[INFO] No CSV files to process initially")
+        # 停止中に変更された会議室設定・分割ルールを保存済みデータに反映
+        rebuild_processed_bookings()
 
     # Start file watcher
     observer = start_file_watcher()
@@ -980,15 +3238,21 @@ def run_server():
         print("[WARNING] File watcher failed to start")
 
     # Test CSV loading
-    bookings = fetch_from_csv()
+    bookings = booking_cache.get().bookings
     print(f"[OK] CSV loaded: {len(bookings)} bookings")
 
+    # Start event stream server
+    if start_event_server():
+        print("[OK] Event stream server started")
+    else:
+        print("[WARNING] Event stream server failed to start (events are served by Flask)")
+
     print("[OK] Starting Flask server...")
     print(f"[INFO] Upload CSV files to: {UPLOADS_DIR}")
     print(f"[INFO] Processed files moved to: {os.path.join(BASE_DIR, 'processed')}")
 
     try:
-        app.run(host='0.0.0.0', port=port, debug=True, use_reloader=False)
+        app.run(host='0.0.0.0', port=port, debug=True, use_reloader=False, request_handler=EventStreamRequestHandler)
     finally:
         if observer:
             observer.stop()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+会議室予約システム - 取り込み処理テストスクリプト
+差分取り込み・文字コード判定・複数時間帯の予約展開・重複予約の検出・差分配信の動作確認を行います
+"""
+
+import sys
+import pandas as pd
+
+from csv_encoding import sniff_encoding
+
+# 分割ルール：room-23 は room-2 と room-3 の両方を使う
+SPLIT_CONFIG = {
+    'csv_column_mapping': {},
+    'data_split_rules': [
+        {'source_room_id': 'room-23', 'target_room_ids': ['room-2', 'room-3'], 'enabled': True}
+    ]
+}
+
+def test_upsert_bookings():
+    """差分取り込み（追加・更新・取消と件数）のテスト"""
+    print(">> 差分取り込みテスト...")
+    from server_fixed import upsert_bookings
+
+    existing = pd.DataFrame({
+        '申込NO': [1, 2, 2, 3],
+        '案内表示名(予約内容)': ['既存1', '既存2午前', '既存2午後', '既存3'],
+        '取消日(予約内容)': ['', '', '', ''],
+    })
+    delta = pd.DataFrame({
+        '申込NO': ['2', '3', '4', '5', '5'],
+        '案内表示名(予約内容)': ['更新2', '取消3', '新規4', '古い5', '新しい5'],
+        '取消日(予約内容)': ['', '2025/07/01', '', '', ''],
+        'source_file': ['b.csv', 'b.csv', 'b.csv', 'a.csv', 'b.csv'],
+    })
+
+    merged, stats, cancelled = upsert_bookings(existing, delta, '申込NO', '取消日(予約内容)')
+
+    assert stats == {'inserted': 2, 'updated': 1, 'cancelled': 1, 'removed_rows': 3}, stats
+    names = dict(zip(merged['申込NO'].astype(str), merged['案内表示名(予約内容)']))
+    assert len(merged) == 4, merged
+    assert names == {'1': '既存1', '2': '更新2', '4': '新規4', '5': '新しい5'}, names
+    assert cancelled['申込NO'].tolist() == ['3'], cancelled
+
+    print(f"✅ 差分取り込み成功 - {stats}")
+    return True
+
+def test_sniff_encoding():
+    """文字コード判定のテスト"""
+    print(">> 文字コード判定テスト...")
+    text = '申込NO,会議室(予約内容)\n1,特別会議室Ａ\n'
+
+    assert sniff_encoding(b'\xef\xbb\xbf' + text.encode('utf-8'))[0] == 'utf-8-sig'
+    assert sniff_encoding(text.encode('utf-8'), complete=True)[0] == 'utf-8'
+    assert sniff_encoding(text.encode('cp932'), complete=True)[0] == 'cp932'
+    assert sniff_encoding(text.encode('iso-2022-jp'))[0] == 'iso-2022-jp'
+    assert sniff_encoding(b'a,b\n1,2\n', complete=True) == ('utf-8', 1.0)
+    # ASCIIだけの先頭部分では推定のため確信度を下げる
+    assert sniff_encoding(b'a,b\n1,2\n') == ('utf-8', 0.5)
+    # 読み込んだ範囲の末尾で切れたマルチバイト文字は、ファイル全体でなければ許容する
+    truncated = text.encode('utf-8')[:-5]
+    assert sniff_encoding(truncated)[0] == 'utf-8'
+
+    print("✅ 文字コード判定成功")
+    return True
+
+def test_multi_slot_bookings():
+    """複数の時間帯をまとめた予約（午前・午後など）の展開テスト"""
+    print(">> 複数時間帯の予約展開テスト...")
+    from ingest_worker import prepare_booking_rows
+
+    df = pd.DataFrame({
+        '申込NO': ['88', '89', '90', '91'],
+        '利用日時(予約内容)': ['2025年10月3日 午前・午後', '2025年8月21日 一日', '2025年7月1日 夜間', '2025年7月3日 午前〜午後'],
+    })
+    rows, rejected = prepare_booking_rows(df, SPLIT_CONFIG)
+
+    found = list(zip(rows['申込NO'], rows['date'], rows['slot']))
+    assert found == [
+        ('88', '2025-10-03', 'morning'), ('88', '2025-10-03', 'afternoon'),
+        ('89', '2025-08-21', 'morning'), ('89', '2025-08-21', 'afternoon'), ('89', '2025-08-21', 'night'),
+        ('90', '2025-07-01', 'night'),
+    ], found
+    # 値全体を解析できない行は最初の時間帯だけを使わずに除外する
+    assert rejected['申込NO'].tolist() == ['91'], rejected
+
+    print(f"✅ 複数時間帯の予約展開成功 - {len(rows)}行 / 除外 {len(rejected)}行")
+    return True
+
+def test_detect_booking_conflicts():
+    """重複予約の検出テスト"""
+    print(">> 重複予約検出テスト...")
+    from server_fixed import detect_booking_conflicts
+
+    df = pd.DataFrame({
+        '申込NO': [1, 2, 3, 3, 4, 5, 6],
+        'date': ['2025-07-01', '2025-07-01', '2025-07-02', '2025-07-02', '2025-07-03', '2025-07-03', '2025-07-04'],
+        'slot': ['morning', 'morning', 'afternoon', 'afternoon', 'night', 'night', 'morning'],
+        'room_id': ['room-a', 'room-a', 'room-a', 'room-a', 'room-23', 'room-2', 'room-a'],
+        'original_room_id': ['', '', '', '', '', '', ''],
+        '取消日(予約内容)': ['', '', '', '', '', '', '2025/06/30'],
+    })
+    # 取り消された予約は重複として扱わない
+    df = pd.concat([df, pd.DataFrame([{
+        '申込NO': 7, 'date': '2025-07-04', 'slot': 'morning', 'room_id': 'room-a',
+        'original_room_id': '', '取消日(予約内容)': ''
+    }])], ignore_index=True)
+
+    conflicts = detect_booking_conflicts(df, SPLIT_CONFIG)
+    found = sorted((conflict['date'], conflict['slot'], tuple(conflict['rooms']),
+                    tuple(booking['booking_no'] for booking in conflict['bookings'])) for conflict in conflicts)
+
+    # 同じ申込NOの行（2025-07-02）は重複ではない。分割ルールのコピー元はコピー先の部屋と重複する
+    assert found == [
+        ('2025-07-01', 'morning', ('room-a',), ('1', '2')),
+        ('2025-07-03', 'night', ('room-2',), ('4', '5')),
+    ], found
+
+    print(f"✅ 重複予約検出成功 - {len(conflicts)}件")
+    return True
+
+def test_booking_cache_changes():
+    """予約キャッシュの差分（/api/bookings/changes）のテスト"""
+    print(">> 予約キャッシュ差分テスト...")
+    from server_fixed import BookingCache
+
+    def booking(no, name):
+        return {'申込NO': no, '利用日時(予約内容)': '2025年7月1日 午前', '会議室(予約内容)': '特別会議室Ａ', '案内表示名(予約内容)': name}
+
+    # 変更が全体の半分を超えると全件取得に切り替わるため、変更しない予約を含めておく
+    unchanged = [booking(no, '変更なし') for no in range(10, 20)]
+    generations = [
+        [booking(1, 'A'), booking(2, 'B')] + unchanged,
+        [booking(1, 'A更新'), booking(2, 'B'), booking(3, 'C')] + unchanged,
+        [booking(1, 'A更新'), booking(3, 'C')] + unchanged,
+    ]
+    cache = BookingCache(lambda: [dict(row) for row in generations.pop(0)], check_interval=3600)
+    for _ in range(3):
+        cache.reload()
+    assert cache.generation == 3
+
+    key = lambda no: f"{no}|2025年7月1日 午前|特別会議室Ａ"
+    changes = cache.changes_since(1)
+    assert not changes['resync'] and changes['generation'] == 3, changes
+    assert [change['key'] for change in changes['updated']] == [key(1)], changes
+    assert changes['updated'][0]['booking']['案内表示名(予約内容)'] == 'A更新'
+    assert [change['key'] for change in changes['inserted']] == [key(3)], changes
+    assert changes['removed'] == [key(2)], changes
+
+    assert cache.changes_since(2)['removed'] == [key(2)]
+    assert cache.changes_since(3)['inserted'] == []
+    # 保持していない世代・未来の世代からは全件を取り直す
+    assert cache.changes_since(0)['resync']
+    assert cache.changes_since(99)['resync']
+
+    print("✅ 予約キャッシュ差分成功")
+    return True
+
+def run_all_tests():
+    """全テストを実行"""
+    print("*** 会議室予約システム - 取り込み処理テスト開始 ***")
+    print("=" * 50)
+
+    tests = [
+        ("差分取り込み", test_upsert_bookings),
+        ("文字コード判定", test_sniff_encoding),
+        ("複数時間帯の予約展開", test_multi_slot_bookings),
+        ("重複予約検出", test_detect_booking_conflicts),
+        ("予約キャッシュ差分", test_booking_cache_changes)
+    ]
+
+    results = []
+
+    for test_name, test_func in tests:
+        print(f"\n🧪 {test_name}テスト実行中...")
+        try:
+            result = test_func()
+            results.append((test_name, result))
+        except Exception as e:
+            print(f"❌ {test_name}テストでエラー: {e!r}")
+            results.append((test_name, False))
+
+    # 結果サマリー
+    print("\n" + "=" * 50)
+    print("📊 テスト結果サマリー")
+    print("=" * 50)
+
+    passed = 0
+    for test_name, result in results:
+        status = "✅ PASS" if result else "❌ FAIL"
+        print(f"{status} {test_name}")
+        if result:
+            passed += 1
+
+    print(f"\n🏆 成功: {passed}/{len(results)}")
+    return passed == len(results)
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)